@@ -1,6 +1,8 @@
 import redis
 import json
 import os
+import time
+import uuid
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,6 +21,13 @@ def cache_top_data(key_prefix, spotify_id, term, data, ttl=3600):
     key = f"{key_prefix}:{spotify_id}:{term}"
     r.setex(key, ttl, json.dumps(data))
 
+def cache_top_data_many(key_prefix, spotify_id, data_by_term, ttl=3600):
+    """Cache several terms for one user in a single pipelined round trip."""
+    pipe = r.pipeline(transaction=False)
+    for term, data in data_by_term.items():
+        pipe.setex(f"{key_prefix}:{spotify_id}:{term}", ttl, json.dumps(data))
+    pipe.execute()
+
 def get_cached_top_data(key_prefix, spotify_id, term):
     key = f"{key_prefix}:{spotify_id}:{term}"
     cached_data = r.get(key)
@@ -97,6 +106,9 @@ def hard_clear_user_cache(spotify_id):
         print(f"CACHE_HANDLER HARD CLEAR ERROR (IMG): {e}")
     
     print(f"CACHE_HANDLER: Nuclear clear total: {count} keys wiped.")
+    # NOTE: Content-addressed analysis entries (nlp:*) are intentionally kept.
+    # They are keyed by lyrics hash + model version, so they can never be stale
+    # for a user; bumping ANALYSIS_MODEL_VERSION is the way to invalidate them.
     return count
 
 def get_analysis_cache(display_name):
@@ -118,22 +130,281 @@ def set_analysis_cache(display_name, data, ttl=604800): # 7 days
     except Exception as e:
         print(f"CACHE_HANDLER ERROR: set_analysis_cache failed: {e}")
 
-def get_image_cache(artist_name):
-    """Retrieve scraped artist image from Redis."""
+def get_lyrics_analysis_cache(lyrics_hash, model_version):
+    """Retrieve analysis results (emotions, mbti) keyed by lyrics hash + model version."""
+    if not lyrics_hash:
+        return None
+    try:
+        cached = r.get(f"nlp:{model_version}:{lyrics_hash}")
+        if cached:
+            return json.loads(cached)
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: get_lyrics_analysis_cache failed: {e}")
+    return None
+
+def set_lyrics_analysis_cache(lyrics_hash, model_version, data, ttl=2592000): # 30 days
+    """Store analysis results under the content address of the lyrics they were computed from."""
+    if not lyrics_hash:
+        return
+    try:
+        r.setex(f"nlp:{model_version}:{lyrics_hash}", ttl, json.dumps(data))
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: set_lyrics_analysis_cache failed: {e}")
+
+def canonical_track_key(track_name, artist_name):
+    """
+    Provider-agnostic key for a (track, artist) pair.
+    Strips version suffixes (" - Remastered", " (Live)", " [Demo]") and normalises case/whitespace.
+    """
+    t = (track_name or "").split(" - ")[0].split(" (")[0].split(" [")[0]
+    t = " ".join(t.lower().split())
+    a = " ".join((artist_name or "").lower().split())
+    return f"{t}|{a}"
+
+def get_lyrics_cache(track_key):
+    """Retrieve a lyrics store entry {"lyrics", "source"} from the Redis hot tier."""
+    try:
+        cached = r.get(f"lyrics:{track_key}")
+        if cached:
+            return json.loads(cached)
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: get_lyrics_cache failed: {e}")
+    return None
+
+def set_lyrics_cache(track_key, lyrics, source, ttl=86400): # 1 day
+    """Store lyrics (or a negative entry when lyrics is None) in the Redis hot tier."""
+    try:
+        r.setex(f"lyrics:{track_key}", max(int(ttl), 1), json.dumps({"lyrics": lyrics, "source": source}))
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: set_lyrics_cache failed: {e}")
+
+def get_artist_songs_cache(artist_id, page=None):
+    """Retrieve a Genius discography (full list, or a single page payload when page is given)."""
+    try:
+        key = f"genius:songs:{artist_id}" if page is None else f"genius:songs:{artist_id}:p{page}"
+        cached = r.get(key)
+        if cached:
+            return json.loads(cached)
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: get_artist_songs_cache failed: {e}")
+    return None
+
+def set_artist_songs_cache(artist_id, data, page=None, ttl=86400): # 1 day
+    """Store a Genius discography (full list, or a single page payload when page is given)."""
+    try:
+        key = f"genius:songs:{artist_id}" if page is None else f"genius:songs:{artist_id}:p{page}"
+        r.setex(key, ttl, json.dumps(data))
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: set_artist_songs_cache failed: {e}")
+
+def get_genius_search_cache(query):
+    """Retrieve cached Genius /search hits for a normalised query."""
+    try:
+        cached = r.get(f"genius:search:{query}")
+        if cached:
+            return json.loads(cached)
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: get_genius_search_cache failed: {e}")
+    return None
+
+def set_genius_search_cache(query, hits, ttl=21600): # 6 hours
+    """Store Genius /search hits for a normalised query."""
+    try:
+        r.setex(f"genius:search:{query}", ttl, json.dumps(hits))
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: set_genius_search_cache failed: {e}")
+
+def get_genius_fetch_strategy():
+    """Which Genius page fetch path ("direct" / "proxy") last worked on this deployment."""
+    try:
+        return r.get("genius:fetch_strategy")
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: get_genius_fetch_strategy failed: {e}")
+        return None
+
+def set_genius_fetch_strategy(strategy, ttl=3600): # Re-probe hourly
+    try:
+        r.setex("genius:fetch_strategy", ttl, strategy)
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: set_genius_fetch_strategy failed: {e}")
+
+def get_autocomplete_cache(query):
+    """Retrieve cached autocomplete suggestions for a normalised query."""
+    try:
+        cached = r.get(f"genius:ac:q:{query}")
+        if cached:
+            return json.loads(cached)
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: get_autocomplete_cache failed: {e}")
+    return None
+
+def set_autocomplete_cache(query, results, ttl=86400): # 1 day
+    """Store autocomplete suggestions for a normalised query."""
+    try:
+        r.setex(f"genius:ac:q:{query}", ttl, json.dumps(results))
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: set_autocomplete_cache failed: {e}")
+
+def index_autocomplete_artists(artists):
+    """
+    Add artists to the lexicographic prefix index (sorted set, all scores 0).
+    Each artist is indexed under its full name and under every later word,
+    so "swi" and "tay" both reach "Taylor Swift".
+    """
+    if not artists: return
+    try:
+        pipe = r.pipeline()
+        for a in artists:
+            words = " ".join(a["name"].lower().split()).split(" ")
+            members = {f"{' '.join(words[i:])}\t{a['id']}": 0 for i in range(len(words))}
+            pipe.zadd("genius:ac:index", members)
+            pipe.hset("genius:ac:artist", a["id"], json.dumps(a))
+        pipe.execute()
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: index_autocomplete_artists failed: {e}")
+
+def search_autocomplete_index(prefix, limit=8):
+    """Return artists whose name (or a later word of it) starts with prefix, via ZRANGEBYLEX."""
+    try:
+        members = r.zrangebylex("genius:ac:index", f"[{prefix}", f"[{prefix}\U0010ffff", start=0, num=limit * 3)
+        ids = []
+        for m in members:
+            artist_id = m.rsplit("\t", 1)[-1]
+            if artist_id not in ids:
+                ids.append(artist_id)
+            if len(ids) >= limit: break
+        if not ids: return []
+        return [json.loads(a) for a in r.hmget("genius:ac:artist", ids) if a]
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: search_autocomplete_index failed: {e}")
+        return []
+
+def get_artist_tags_cache_many(artist_keys):
+    """Batch-read artist tag entries ({"tags", "refreshed_at"}) with a single MGET."""
+    if not artist_keys: return {}
+    try:
+        values = r.mget([f"artist_tags:{k}" for k in artist_keys])
+        return {k: json.loads(v) for k, v in zip(artist_keys, values) if v}
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: get_artist_tags_cache_many failed: {e}")
+        return {}
+
+def set_artist_tags_cache_many(entries, ttl=604800): # 7 days
+    """Store {artist_key: {"tags", "refreshed_at"}} entries in one pipeline."""
+    if not entries: return
+    try:
+        pipe = r.pipeline()
+        for k, v in entries.items():
+            pipe.setex(f"artist_tags:{k}", ttl, json.dumps(v))
+        pipe.execute()
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: set_artist_tags_cache_many failed: {e}")
+
+def get_spotify_app_token_cache():
+    """Shared Spotify client-credentials token {"token", "expires_at"} (epoch seconds)."""
+    try:
+        cached = r.get("spotify:app_token")
+        if cached:
+            return json.loads(cached)
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: get_spotify_app_token_cache failed: {e}")
+    return None
+
+def set_spotify_app_token_cache(token, expires_at, ttl):
+    try:
+        r.setex("spotify:app_token", max(int(ttl), 1), json.dumps({"token": token, "expires_at": expires_at}))
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: set_spotify_app_token_cache failed: {e}")
+
+def get_lastfm_user_info_cache(username):
+    """Last.fm user.getInfo payload, kept briefly so dashboard reads don't hit Last.fm every time."""
+    try:
+        cached = r.get(f"lastfm:user_info:{username.lower()}")
+        if cached:
+            return json.loads(cached)
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: get_lastfm_user_info_cache failed: {e}")
+    return None
+
+def set_lastfm_user_info_cache(username, info, ttl=300): # 5 minutes
+    try:
+        r.setex(f"lastfm:user_info:{username.lower()}", ttl, json.dumps(info))
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: set_lastfm_user_info_cache failed: {e}")
+
+def get_lastfm_enhance_input(sync_id):
+    """Fast-sync result a Last.fm enhancement worker was queued for (see set_lastfm_enhance_input)."""
+    try:
+        cached = r.get(f"lastfm:enhance:{sync_id}")
+        if cached:
+            return json.loads(cached)
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: get_lastfm_enhance_input failed: {e}")
+    return None
+
+def set_lastfm_enhance_input(sync_id, result, ttl=7200): # 2 hours, longer than QStash's retry window
+    try:
+        r.setex(f"lastfm:enhance:{sync_id}", ttl, json.dumps(result))
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: set_lastfm_enhance_input failed: {e}")
+
+def delete_lastfm_enhance_input(sync_id):
+    try:
+        r.delete(f"lastfm:enhance:{sync_id}")
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: delete_lastfm_enhance_input failed: {e}")
+
+def get_image_cache_entry(artist_name):
+    """
+    Retrieve a scraped image entry {"url", "validated_at", "size"} from Redis.
+    Legacy entries (plain URL strings) come back with validated_at = 0.
+    """
     try:
         key = f"img:{artist_name.lower().strip()}"
-        return r.get(key)
+        cached = r.get(key)
+        if not cached:
+            return None
+        if cached.startswith("{"):
+            return json.loads(cached)
+        return {"url": cached, "validated_at": 0, "size": None}
     except:
         return None
 
-def set_image_cache(artist_name, img_url, ttl=604800): # 7 days
-    """Store scraped artist image in Redis."""
+def get_image_cache(artist_name):
+    """Retrieve scraped artist image URL from Redis."""
+    entry = get_image_cache_entry(artist_name)
+    return entry["url"] if entry else None
+
+IMAGE_CACHE_TTL = 604800 # 7 days
+
+def set_image_cache(artist_name, img_url, ttl=IMAGE_CACHE_TTL, validated_at=None, size=None):
+    """Store scraped artist image in Redis, along with when (and at what size) it was last validated."""
     try:
         key = f"img:{artist_name.lower().strip()}"
-        r.setex(key, ttl, img_url)
+        r.setex(key, ttl, json.dumps({"url": img_url, "validated_at": validated_at or 0, "size": size}))
     except:
         pass
 
+def get_track_image_cache(track_key):
+    """
+    Retrieve resolved track artwork {"id", "image", "validated_at"} keyed by canonical_track_key.
+    A negative entry (nothing found) has an empty image.
+    """
+    try:
+        cached = r.get(f"img:track:{track_key}")
+        if cached:
+            return json.loads(cached)
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: get_track_image_cache failed: {e}")
+    return None
+
+def set_track_image_cache(track_key, sp_id, image, ttl=604800): # 7 days
+    """Store resolved track artwork (Spotify id + image URL); pass image="" for a negative entry."""
+    try:
+        r.setex(f"img:track:{track_key}", ttl, json.dumps({"id": sp_id, "image": image or "", "validated_at": time.time()}))
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: set_track_image_cache failed: {e}")
+
 def delete_image_cache(artist_name):
     """Delete scraped artist image from Redis."""
     try:
@@ -169,6 +440,68 @@ def get_valid_image_cache(artist_name: str) -> str | None:
         return cached # type: ignore
     return None
 
+# Delete the lock only if it still holds our token (it may have expired and been taken over)
+_RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+_release_lock_script = None
+
+def _release_lock(lock_key, token):
+    global _release_lock_script
+    try:
+        if _release_lock_script is None:
+            _release_lock_script = r.register_script(_RELEASE_LOCK_LUA)
+        _release_lock_script(keys=[lock_key], args=[token])
+    except Exception as e:
+        print(f"CACHE_HANDLER UNLOCK ERROR: {e}")
+
+def get_or_compute(key, compute, ttl, cacheable=None, lock_ttl=60, wait_timeout=30):
+    """
+    Read-through cache with single-flight protection.
+    Only the caller holding lock:{key} runs compute(); concurrent callers (any instance)
+    poll for the result instead of repeating the work. Falls back to computing directly
+    if Redis is unavailable or the lock holder doesn't deliver in time.
+    cacheable(value) decides whether a result is stored (default: anything but None).
+    lock_ttl and wait_timeout must cover compute()'s worst-case duration, otherwise waiters
+    start computing in parallel and the lock can expire mid-compute.
+    """
+    cacheable = cacheable or (lambda v: v is not None)
+    lock_key = f"lock:{key}"
+    token = uuid.uuid4().hex
+    try:
+        cached = r.get(key)
+        if cached:
+            return json.loads(cached)
+        acquired = r.set(lock_key, token, ex=lock_ttl, nx=True)
+    except Exception as e:
+        print(f"CACHE_HANDLER ERROR: get_or_compute({key}) read failed: {e}")
+        return compute()
+
+    if not acquired:
+        deadline = time.time() + wait_timeout
+        try:
+            while time.time() < deadline:
+                time.sleep(0.2)
+                cached = r.get(key)
+                if cached:
+                    return json.loads(cached)
+                if not r.exists(lock_key):
+                    break # Holder finished without caching (error result) or died
+        except Exception as e:
+            print(f"CACHE_HANDLER ERROR: get_or_compute({key}) wait failed: {e}")
+        return compute()
+
+    try:
+        value = compute()
+        if cacheable(value):
+            r.setex(key, ttl, json.dumps(value))
+        return value
+    finally:
+        _release_lock(lock_key, token)
+
 def acquire_analysis_lock(spotify_id, term, ttl=300):
     """
     Attempt to acquire a non-blocking lock for a specific user analysis task.
@@ -4,6 +4,8 @@ import psycopg2 # type: ignore
 from psycopg2.extras import execute_values # type: ignore
 from urllib.parse import urlparse
 import threading
+import time
+import zlib
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -220,6 +222,95 @@ def init_db():
             cur.execute("ALTER TABLE artists ADD COLUMN IF NOT EXISTS image_url TEXT;")
             conn.commit()
 
+            # Durable per-track NLP results (Redis analysis:* is the hot tier in front of this)
+            # Scores are stored as fixed-order vectors, see nlp_handler.EMOTION_VECTOR_LABELS / MBTI_VECTOR_LABELS
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS track_analysis (
+                    track_key TEXT PRIMARY KEY,
+                    lyrics_hash TEXT,
+                    model_version TEXT,
+                    source TEXT,
+                    emotion_scores REAL[],
+                    mbti_scores REAL[],
+                    analyzed_at TIMESTAMP DEFAULT NOW()
+                );
+                CREATE INDEX IF NOT EXISTS idx_track_analysis_lyrics_hash
+                    ON track_analysis (lyrics_hash, model_version);
+            """)
+            conn.commit()
+
+            # Durable lyrics store keyed by cache_handler.canonical_track_key (Redis lyrics:* is the hot tier).
+            # lyrics is zlib-compressed UTF-8; NULL lyrics + retry_after marks a "no lyrics found" entry.
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS track_lyrics (
+                    track_key TEXT PRIMARY KEY,
+                    lyrics BYTEA,
+                    source TEXT,
+                    miss_count INTEGER DEFAULT 0,
+                    fetched_at TIMESTAMP DEFAULT NOW(),
+                    retry_after TIMESTAMP
+                );
+            """)
+            conn.commit()
+
+            # Global artist tag (genre) metadata shared by every user's Last.fm enhancement.
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS artist_tags (
+                    artist_key TEXT PRIMARY KEY,
+                    artist_name TEXT,
+                    tags TEXT[] NOT NULL,
+                    refreshed_at TIMESTAMP DEFAULT NOW()
+                );
+            """)
+            conn.commit()
+
+            # Durable index of resolved artist/track imagery behind the img:* Redis keys.
+            # name_key is the normalised artist name (kind='artist') or canonical track|artist key (kind='track').
+            # image_url NULL marks a lookup that found nothing.
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS media_metadata (
+                    kind TEXT NOT NULL,
+                    name_key TEXT NOT NULL,
+                    name TEXT,
+                    artist_name TEXT,
+                    spotify_id TEXT,
+                    image_url TEXT,
+                    provider TEXT,
+                    validated_at TIMESTAMP DEFAULT NOW(),
+                    last_checked TIMESTAMP DEFAULT NOW(),
+                    PRIMARY KEY (kind, name_key)
+                );
+                ALTER TABLE media_metadata ADD COLUMN IF NOT EXISTS last_checked TIMESTAMP DEFAULT NOW();
+                CREATE INDEX IF NOT EXISTS idx_media_metadata_validated_at
+                    ON media_metadata (validated_at);
+                CREATE INDEX IF NOT EXISTS idx_media_metadata_last_checked
+                    ON media_metadata (last_checked);
+            """)
+            conn.commit()
+
+            # Last.fm scrobble history (user.getRecentTracks), range-partitioned by month.
+            # Monthly partitions are created on demand by save_scrobbles_batch. The primary key
+            # (user_id, played_at, artist_name, track_name) includes the partition key and, led by
+            # (user_id, played_at), serves per-user date-range aggregates within the months involved.
+            # scrobble_cursors keeps the newest ingested timestamp per user so later syncs resume from it.
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS scrobbles (
+                    user_id TEXT NOT NULL,
+                    played_at TIMESTAMP NOT NULL,
+                    artist_name TEXT NOT NULL,
+                    track_name TEXT NOT NULL,
+                    album_name TEXT,
+                    PRIMARY KEY (user_id, played_at, artist_name, track_name)
+                ) PARTITION BY RANGE (played_at);
+
+                CREATE TABLE IF NOT EXISTS scrobble_cursors (
+                    user_id TEXT PRIMARY KEY,
+                    last_uts BIGINT NOT NULL,
+                    updated_at TIMESTAMP DEFAULT NOW()
+                );
+            """)
+            conn.commit()
+
 def save_user(spotify_id, display_name):
     # PRIMARY: Write to Neon (blocking, must succeed)
     with get_conn() as conn:
@@ -385,6 +476,371 @@ def save_user_associations_batch(table_name, column_name, spotify_id, item_ids):
             """, data_to_insert)
             conn.commit()
 
+def save_sync_batch(spotify_id, display_name, artists_data, tracks_data, artist_ids, track_ids):
+    """
+    Save everything a top-data sync produces (user, artists, tracks, user associations)
+    in one transaction on a single pooled connection.
+    """
+    # PRIMARY: Write to Neon
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO users (spotify_id, display_name)
+                VALUES (%s, %s)
+                ON CONFLICT (spotify_id) DO UPDATE SET display_name = EXCLUDED.display_name
+            """, (spotify_id, display_name))
+
+            if artists_data:
+                execute_values(cur, """
+                    INSERT INTO artists (id, name, popularity, image_url)
+                    VALUES %s
+                    ON CONFLICT (id) DO UPDATE SET
+                        name = EXCLUDED.name,
+                        popularity = EXCLUDED.popularity,
+                        image_url = EXCLUDED.image_url
+                """, artists_data)
+
+            if tracks_data:
+                execute_values(cur, """
+                    INSERT INTO tracks (id, name, popularity, preview_url, image_url)
+                    VALUES %s
+                    ON CONFLICT (id) DO UPDATE SET
+                        name = EXCLUDED.name,
+                        popularity = EXCLUDED.popularity,
+                        preview_url = EXCLUDED.preview_url,
+                        image_url = EXCLUDED.image_url
+                """, tracks_data)
+
+            if artist_ids:
+                execute_values(cur, """
+                    INSERT INTO user_artists (spotify_id, artist_id)
+                    VALUES %s
+                    ON CONFLICT DO NOTHING
+                """, [(spotify_id, artist_id) for artist_id in artist_ids])
+
+            if track_ids:
+                execute_values(cur, """
+                    INSERT INTO user_tracks (spotify_id, track_id)
+                    VALUES %s
+                    ON CONFLICT DO NOTHING
+                """, [(spotify_id, track_id) for track_id in track_ids])
+            conn.commit()
+
+    # SECONDARY: Write to Supabase (async)
+    async_write_to_supabase("""
+        INSERT INTO users (spotify_id, display_name)
+        VALUES (%s, %s)
+        ON CONFLICT (spotify_id) DO UPDATE SET display_name = EXCLUDED.display_name
+    """, (spotify_id, display_name))
+    if artists_data:
+        async_batch_write_to_supabase("""
+            INSERT INTO artists (id, name, popularity, image_url)
+            VALUES %s
+            ON CONFLICT (id) DO UPDATE SET
+                name = EXCLUDED.name,
+                popularity = EXCLUDED.popularity,
+                image_url = EXCLUDED.image_url
+        """, artists_data)
+    if tracks_data:
+        async_batch_write_to_supabase("""
+            INSERT INTO tracks (id, name, popularity, preview_url, image_url)
+            VALUES %s
+            ON CONFLICT (id) DO UPDATE SET
+                name = EXCLUDED.name,
+                popularity = EXCLUDED.popularity,
+                preview_url = EXCLUDED.preview_url,
+                image_url = EXCLUDED.image_url
+        """, tracks_data)
+
+def get_track_analyses_batch(track_keys, model_version):
+    """Fetch stored analyses for many tracks in one indexed SELECT. Returns {track_key: row}."""
+    if not track_keys: return {}
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT track_key, lyrics_hash, source, emotion_scores, mbti_scores
+                FROM track_analysis
+                WHERE track_key = ANY(%s) AND model_version = %s
+            """, (list(track_keys), model_version))
+            return {
+                row[0]: {
+                    "lyrics_hash": row[1],
+                    "source": row[2],
+                    "emotion_scores": row[3],
+                    "mbti_scores": row[4]
+                }
+                for row in cur.fetchall()
+            }
+
+def get_track_analysis_by_hash(lyrics_hash, model_version):
+    """Find any stored analysis computed from the same lyrics with the same model."""
+    if not lyrics_hash: return None
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT emotion_scores, mbti_scores
+                FROM track_analysis
+                WHERE lyrics_hash = %s AND model_version = %s
+                LIMIT 1
+            """, (lyrics_hash, model_version))
+            row = cur.fetchone()
+            if not row: return None
+            return {"emotion_scores": row[0], "mbti_scores": row[1]}
+
+def save_track_analysis(track_key, lyrics_hash, model_version, source, emotion_scores, mbti_scores):
+    """Upsert the analysis result for one track."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO track_analysis (track_key, lyrics_hash, model_version, source, emotion_scores, mbti_scores, analyzed_at)
+                VALUES (%s, %s, %s, %s, %s, %s, NOW())
+                ON CONFLICT (track_key) DO UPDATE SET
+                    lyrics_hash = EXCLUDED.lyrics_hash,
+                    model_version = EXCLUDED.model_version,
+                    source = EXCLUDED.source,
+                    emotion_scores = EXCLUDED.emotion_scores,
+                    mbti_scores = EXCLUDED.mbti_scores,
+                    analyzed_at = NOW()
+            """, (track_key, lyrics_hash, model_version, source, emotion_scores, mbti_scores))
+            conn.commit()
+
+def get_track_lyrics(track_key):
+    """
+    Read a lyrics store row. Returns None if unknown, otherwise
+    {"lyrics": str | None, "source": str, "retry_in": seconds until a negative entry expires}.
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT lyrics, source, EXTRACT(EPOCH FROM (retry_after - NOW()))
+                FROM track_lyrics WHERE track_key = %s
+            """, (track_key,))
+            row = cur.fetchone()
+            if not row: return None
+            lyrics = zlib.decompress(bytes(row[0])).decode("utf-8") if row[0] is not None else None
+            return {"lyrics": lyrics, "source": row[1], "retry_in": float(row[2] or 0)}
+
+def save_track_lyrics(track_key, lyrics, source):
+    """Store found lyrics (compressed) and reset any negative-entry backoff."""
+    compressed = psycopg2.Binary(zlib.compress(lyrics.encode("utf-8"), 9))
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO track_lyrics (track_key, lyrics, source, miss_count, fetched_at, retry_after)
+                VALUES (%s, %s, %s, 0, NOW(), NULL)
+                ON CONFLICT (track_key) DO UPDATE SET
+                    lyrics = EXCLUDED.lyrics,
+                    source = EXCLUDED.source,
+                    miss_count = 0,
+                    fetched_at = NOW(),
+                    retry_after = NULL
+            """, (track_key, compressed, source))
+            conn.commit()
+
+def save_track_lyrics_miss(track_key, base_backoff, max_backoff):
+    """
+    Record a "no lyrics found" entry. The retry window doubles with every
+    consecutive miss (base_backoff, 2x, 4x ... capped at max_backoff seconds).
+    Returns the retry window in seconds.
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO track_lyrics (track_key, lyrics, source, miss_count, fetched_at, retry_after)
+                VALUES (%s, NULL, 'none', 1, NOW(), NOW() + make_interval(secs => %s))
+                ON CONFLICT (track_key) DO UPDATE SET
+                    lyrics = NULL,
+                    source = 'none',
+                    miss_count = track_lyrics.miss_count + 1,
+                    fetched_at = NOW(),
+                    retry_after = NOW() + make_interval(secs => LEAST(%s * POWER(2, track_lyrics.miss_count), %s))
+                RETURNING EXTRACT(EPOCH FROM (retry_after - NOW()))
+            """, (track_key, base_backoff, base_backoff, max_backoff))
+            row = cur.fetchone()
+            conn.commit()
+            return float(row[0]) if row else base_backoff
+
+def get_artist_tags_batch(artist_keys):
+    """Batch-read artist tag rows. Returns {artist_key: {"tags": [...], "refreshed_at": epoch seconds}}."""
+    if not artist_keys: return {}
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT artist_key, tags, EXTRACT(EPOCH FROM (NOW() - refreshed_at))
+                FROM artist_tags WHERE artist_key = ANY(%s)
+            """, (list(artist_keys),))
+            now = time.time()
+            return {key: {"tags": list(tags or []), "refreshed_at": now - float(age)} for key, tags, age in cur.fetchall()}
+
+def save_artist_tags_batch(rows):
+    """Upsert (artist_key, artist_name, tags) rows and stamp them as freshly refreshed."""
+    if not rows: return
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                INSERT INTO artist_tags (artist_key, artist_name, tags)
+                VALUES %s
+                ON CONFLICT (artist_key) DO UPDATE SET
+                    artist_name = EXCLUDED.artist_name,
+                    tags = EXCLUDED.tags,
+                    refreshed_at = NOW()
+            """, rows)
+            conn.commit()
+
+def get_media_metadata_batch(kind, name_keys):
+    """
+    Batch-read resolved imagery for artists or tracks.
+    Returns {name_key: {"spotify_id", "image_url", "provider", "age"}} where age is seconds since validation.
+    """
+    if not name_keys: return {}
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT name_key, spotify_id, image_url, provider, EXTRACT(EPOCH FROM (NOW() - validated_at))
+                FROM media_metadata WHERE kind = %s AND name_key = ANY(%s)
+            """, (kind, list(name_keys)))
+            return {
+                key: {"spotify_id": sp_id, "image_url": img, "provider": provider, "age": float(age)}
+                for key, sp_id, img, provider, age in cur.fetchall()
+            }
+
+def save_media_metadata_batch(rows):
+    """Upsert (kind, name_key, name, artist_name, spotify_id, image_url, provider) rows, stamping validated_at."""
+    if not rows: return
+    # A batch can't touch the same key twice in one upsert; keep the last row per key
+    rows = list({(r[0], r[1]): r for r in rows}.values())
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                INSERT INTO media_metadata (kind, name_key, name, artist_name, spotify_id, image_url, provider)
+                VALUES %s
+                ON CONFLICT (kind, name_key) DO UPDATE SET
+                    name = EXCLUDED.name,
+                    artist_name = EXCLUDED.artist_name,
+                    spotify_id = COALESCE(EXCLUDED.spotify_id, media_metadata.spotify_id),
+                    image_url = EXCLUDED.image_url,
+                    provider = EXCLUDED.provider,
+                    validated_at = NOW(),
+                    last_checked = NOW()
+            """, rows)
+            conn.commit()
+
+def get_stale_media_metadata(max_age_seconds, recheck_seconds, limit=50):
+    """
+    Rows not validated within max_age_seconds and not checked within recheck_seconds,
+    least recently checked first: [(kind, name_key, name, artist_name)].
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT kind, name_key, name, artist_name FROM media_metadata
+                WHERE validated_at < NOW() - make_interval(secs => %s)
+                  AND last_checked < NOW() - make_interval(secs => %s)
+                ORDER BY last_checked ASC
+                LIMIT %s
+            """, (max_age_seconds, recheck_seconds, limit))
+            return cur.fetchall()
+
+def mark_media_metadata_checked(keys):
+    """Stamp last_checked on (kind, name_key) rows a refresh looked at, resolved or not."""
+    if not keys: return
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                UPDATE media_metadata m SET last_checked = NOW()
+                FROM (VALUES %s) AS v (kind, name_key)
+                WHERE m.kind = v.kind AND m.name_key = v.name_key
+            """, list(keys))
+            conn.commit()
+
+def _ensure_scrobble_partitions(cur, months):
+    """
+    Create the monthly scrobbles partitions for (year, month) pairs that don't exist yet.
+    Creation is serialised with a transaction-scoped advisory lock: concurrent
+    CREATE TABLE IF NOT EXISTS ... PARTITION OF for the same month can otherwise fail.
+    """
+    for year, month in sorted(months):
+        cur.execute("SELECT to_regclass(%s)", (f"scrobbles_{year:04d}_{month:02d}",))
+        if cur.fetchone()[0] is not None:
+            continue
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('scrobbles_partitions'))")
+        next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS scrobbles_{year:04d}_{month:02d} PARTITION OF scrobbles
+            FOR VALUES FROM ('{year:04d}-{month:02d}-01') TO ('{next_year:04d}-{next_month:02d}-01')
+        """)
+
+def save_scrobbles_batch(user_id, rows):
+    """
+    Insert (uts, artist_name, track_name, album_name) scrobbles for a user (uts = Last.fm epoch seconds, UTC).
+    Already-stored scrobbles are ignored, so overlapping pages are safe to re-ingest.
+    """
+    if not rows: return
+    months = {time.gmtime(int(r[0]))[:2] for r in rows}
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            _ensure_scrobble_partitions(cur, months)
+            execute_values(cur, """
+                INSERT INTO scrobbles (user_id, played_at, artist_name, track_name, album_name)
+                VALUES %s
+                ON CONFLICT DO NOTHING
+            """, [(user_id, int(uts), artist, track, album) for uts, artist, track, album in rows],
+                template="(%s, to_timestamp(%s) AT TIME ZONE 'UTC', %s, %s, %s)")
+            conn.commit()
+
+def get_scrobble_cursor(user_id):
+    """Newest ingested scrobble timestamp (epoch seconds) for a user, or None before the first backfill."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT last_uts FROM scrobble_cursors WHERE user_id = %s", (user_id,))
+            row = cur.fetchone()
+            return int(row[0]) if row else None
+
+def set_scrobble_cursor(user_id, last_uts):
+    """Advance (never rewind) the ingestion cursor for a user."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO scrobble_cursors (user_id, last_uts) VALUES (%s, %s)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    last_uts = GREATEST(scrobble_cursors.last_uts, EXCLUDED.last_uts),
+                    updated_at = NOW()
+            """, (user_id, int(last_uts)))
+            conn.commit()
+
+def get_scrobble_top(user_id, kind, start_uts, end_uts, limit=20):
+    """
+    Top artists or tracks from stored scrobbles between two epoch timestamps (end exclusive).
+    Returns [{"name", "artist" (tracks only), "playcount"}] ordered by play count.
+    """
+    group = "artist_name" if kind == "artists" else "artist_name, track_name"
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT {group}, COUNT(*) AS playcount
+                FROM scrobbles
+                WHERE user_id = %s
+                  AND played_at >= to_timestamp(%s) AT TIME ZONE 'UTC'
+                  AND played_at < to_timestamp(%s) AT TIME ZONE 'UTC'
+                GROUP BY {group}
+                ORDER BY playcount DESC, {group}
+                LIMIT %s
+            """, (user_id, int(start_uts), int(end_uts), limit))
+            if kind == "artists":
+                return [{"name": artist, "playcount": count} for artist, count in cur.fetchall()]
+            return [{"name": track, "artist": artist, "playcount": count} for artist, track, count in cur.fetchall()]
+
+def get_scrobble_count(user_id, start_uts, end_uts):
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT COUNT(*) FROM scrobbles
+                WHERE user_id = %s
+                  AND played_at >= to_timestamp(%s) AT TIME ZONE 'UTC'
+                  AND played_at < to_timestamp(%s) AT TIME ZONE 'UTC'
+            """, (user_id, int(start_uts), int(end_uts)))
+            return cur.fetchone()[0]
+
 def get_aggregate_stats():
     stats = {}
     with get_conn() as conn:
@@ -444,7 +900,7 @@ def get_user_db_details(spotify_id: str):
 
     return details
 
-import requests
+from app import http_handler
 import json
 import threading
 from datetime import datetime, timedelta, timezone
@@ -463,14 +919,14 @@ def _send_log_direct(level, message, source):
 
         log_entry = f"[{level}] {source}: {message} | {timestamp}"
 
-        requests.post(
+        http_handler.post(
             UPSTASH_URL,
             headers={"Authorization": f"Bearer {UPSTASH_TOKEN}"},
             json=["RPUSH", "system:logs", log_entry],
             timeout=1
         )
 
-        requests.post(
+        http_handler.post(
             UPSTASH_URL,
             headers={"Authorization": f"Bearer {UPSTASH_TOKEN}"},
             json=["LTRIM", "system:logs", -100, -1],
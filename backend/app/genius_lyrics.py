@@ -1,8 +1,13 @@
 import os
-import requests
+from app import http_handler
 import re
 import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from bs4 import BeautifulSoup
+from app.lyrics_extractor import extract_lyrics_html
+from app.lrclib_handler import get_local_lyrics
 
 GENIUS_TOKEN = os.getenv("GENIUS_ACCESS_TOKEN")
 GENIUS_API_URL = "https://api.genius.com"
@@ -31,37 +36,191 @@ def clean_lyrics(text):
         cleaned.append(s)
     return "\n".join(cleaned)
 
-def get_page_html(url):
-    translate_url = f"https://translate.google.com/translate?sl=auto&tl=en&u={url}&client=webapp"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    }
-    # Reduce retries and timeout for Vercel Serverless (max 60s total execution)
-    # Shorter timeout (1.5s) to prevent dashboard hanging
+_BROWSER_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept-Language": "en-US,en;q=0.9"
+}
+
+# "auto" tries the strategy that last worked on this deployment first, then the other one.
+# Set GENIUS_FETCH_STRATEGY=direct|proxy to pin one.
+GENIUS_FETCH_STRATEGY = os.getenv("GENIUS_FETCH_STRATEGY", "auto").lower()
+_STRATEGY_LOCAL_TTL = 300
+
+_LYRICS_MARKERS = (b"data-lyrics-container", b'class="lyrics"')
+# Blocks Genius renders right after the last lyrics container; once seen, the rest of the page is irrelevant.
+_LYRICS_END_MARKERS = (b"LyricsFooter", b"Lyrics__Footer", b"SongPageGriddesktop__LowerSection")
+
+_strategy_state = {"value": None, "checked_at": 0.0}
+
+def _preferred_strategy():
+    from app.cache_handler import get_genius_fetch_strategy
+
+    if GENIUS_FETCH_STRATEGY in ("direct", "proxy"):
+        return GENIUS_FETCH_STRATEGY
+    now = time.monotonic()
+    if _strategy_state["value"] and now - _strategy_state["checked_at"] < _STRATEGY_LOCAL_TTL:
+        return _strategy_state["value"]
+    # After the shared entry expires, re-probe the direct path first
+    value = get_genius_fetch_strategy() or "direct"
+    _strategy_state.update(value=value, checked_at=now)
+    return value
+
+def _remember_strategy(strategy):
+    from app.cache_handler import set_genius_fetch_strategy
+
+    if _strategy_state["value"] != strategy:
+        print(f"GENIUS FETCH: SWITCHING TO '{strategy.upper()}' STRATEGY.")
+        set_genius_fetch_strategy(strategy)
+    _strategy_state.update(value=strategy, checked_at=time.monotonic())
+
+def _read_until_lyrics_end(res):
+    """Stream the body and stop as soon as the lyrics block has been fully received."""
+    buf = bytearray()
+    lyrics_at = -1 # Offset of the first lyrics container; end markers only count after it
     try:
+        for chunk in res.iter_content(chunk_size=16384):
+            if not chunk: continue
+            scan_from = max(0, len(buf) - 64)
+            buf.extend(chunk)
+            if lyrics_at == -1:
+                found = [i for i in (buf.find(m, scan_from) for m in _LYRICS_MARKERS) if i != -1]
+                lyrics_at = min(found) if found else -1
+            if lyrics_at != -1 and any(buf.find(m, max(scan_from, lyrics_at)) != -1 for m in _LYRICS_END_MARKERS):
+                break
+    finally:
+        res.close()
+    return bytes(buf).decode(res.encoding or "utf-8", errors="replace"), lyrics_at != -1
+
+def _fetch_page(url, strategy):
+    if strategy == "proxy":
         print(f"ATTEMPTING GOOGLE TRANSLATE PROXY: {url}")
-        r = requests.get(translate_url, headers=headers, timeout=5.0)
-        
-        if r.status_code == 200:
-            return r.text
-        else:
-            print(f"GOOGLE TRANSLATE BLOCKED ({r.status_code}).")
-            
+        target = f"https://translate.google.com/translate?sl=auto&tl=en&u={url}&client=webapp"
+    else:
+        print(f"ATTEMPTING DIRECT GENIUS FETCH: {url}")
+        target = url
+    try:
+        # No transport retries: get_page_html falls back to the other strategy instead
+        r = http_handler.get(target, headers=_BROWSER_HEADERS, timeout=5.0, stream=True, retries=0)
+        if r.status_code != 200:
+            r.close()
+            print(f"GENIUS FETCH ({strategy.upper()}) BLOCKED ({r.status_code}).")
+            return None
+        html, has_lyrics = _read_until_lyrics_end(r)
+        if not has_lyrics:
+            # Challenge / consent pages come back as 200 without any lyrics markup
+            print(f"GENIUS FETCH ({strategy.upper()}): NO LYRICS MARKUP IN RESPONSE.")
+            return None
+        return html
     except Exception as e:
-        print(f"GOOGLE TRANSLATE ERROR: {e}")
+        print(f"GENIUS FETCH ({strategy.upper()}) ERROR: {e}")
+        return None
 
+def get_page_html(url):
+    """
+    Fetch a Genius song page, either directly or through the Google Translate proxy.
+    The strategy that last worked is tried first and remembered per deployment.
+    """
+    preferred = _preferred_strategy()
+    order = [preferred] if GENIUS_FETCH_STRATEGY in ("direct", "proxy") else [preferred, "proxy" if preferred == "direct" else "direct"]
+    for strategy in order:
+        html = _fetch_page(url, strategy)
+        if html:
+            if GENIUS_FETCH_STRATEGY == "auto":
+                _remember_strategy(strategy)
+            return html
     return None
 
+# Shared /search cache: in-process LRU (per instance, short TTL) in front of Redis (shared, longer TTL).
+GENIUS_SEARCH_LRU_SIZE = int(os.getenv("GENIUS_SEARCH_LRU_SIZE", 512))
+GENIUS_SEARCH_LRU_TTL = int(os.getenv("GENIUS_SEARCH_LRU_TTL", 600))
+GENIUS_SEARCH_REDIS_TTL = int(os.getenv("GENIUS_SEARCH_REDIS_TTL", 21600))
+
+_search_lru = OrderedDict()
+_search_lock = threading.Lock()
+_search_metrics = {"lru_hits": 0, "redis_hits": 0, "misses": 0, "errors": 0}
+
+def _count(metric):
+    with _search_lock:
+        _search_metrics[metric] += 1
+
+def _slim_hit(hit):
+    """Keep only the fields our call sites read, so cached payloads stay small."""
+    result = hit.get("result", {})
+    artist = result.get("primary_artist") or {}
+    return {
+        "type": hit.get("type"),
+        "result": {
+            "id": result.get("id"),
+            "title": result.get("title", ""),
+            "url": result.get("url"),
+            "primary_artist": {
+                "id": artist.get("id"),
+                "name": artist.get("name", ""),
+                "image_url": artist.get("image_url")
+            }
+        }
+    }
+
+def genius_search(query, timeout=5, retries=None):
+    """
+    Cached Genius /search. Returns the list of hits, or None if the upstream call failed
+    (failures are never cached). Every Genius search call site goes through here.
+    retries is passed to http_handler (0 for latency-bound callers).
+    """
+    from app.cache_handler import get_genius_search_cache, set_genius_search_cache
+
+    key = " ".join((query or "").lower().split())
+    now = time.monotonic()
+
+    with _search_lock:
+        entry = _search_lru.get(key)
+        if entry and entry[0] > now:
+            _search_lru.move_to_end(key)
+            _search_metrics["lru_hits"] += 1
+            return entry[1]
+
+    hits = get_genius_search_cache(key)
+    if hits is not None:
+        _count("redis_hits")
+    else:
+        _count("misses")
+        try:
+            res = http_handler.get(
+                f"{GENIUS_API_URL}/search",
+                params={"q": query},
+                headers=get_headers(),
+                timeout=timeout,
+                retries=retries
+            )
+            if res.status_code != 200:
+                _count("errors")
+                return None
+            hits = [_slim_hit(h) for h in res.json().get("response", {}).get("hits", [])]
+        except Exception as e:
+            print(f"GENIUS SEARCH ERROR: {e}")
+            _count("errors")
+            return None
+        set_genius_search_cache(key, hits, GENIUS_SEARCH_REDIS_TTL)
+
+    with _search_lock:
+        _search_lru[key] = (now + GENIUS_SEARCH_LRU_TTL, hits)
+        _search_lru.move_to_end(key)
+        while len(_search_lru) > GENIUS_SEARCH_LRU_SIZE:
+            _search_lru.popitem(last=False)
+    return hits
+
+def get_genius_search_metrics():
+    with _search_lock:
+        m = dict(_search_metrics)
+        m["lru_size"] = len(_search_lru)
+    lookups = m["lru_hits"] + m["redis_hits"] + m["misses"]
+    m["hit_rate"] = round((m["lru_hits"] + m["redis_hits"]) / lookups, 4) if lookups else 0
+    return m
+
 def search_artist_id(query):
     try:
-        res = requests.get(
-            f"{GENIUS_API_URL}/search",
-            params={"q": query},
-            headers=get_headers(),
-            timeout=3
-        )
-        if res.status_code != 200: return []
-        hits = res.json()["response"]["hits"]
+        hits = genius_search(query, timeout=3)
+        if hits is None: return []
         artists = []
         seen = set()
         for hit in hits:
@@ -73,16 +232,66 @@ def search_artist_id(query):
         return artists
     except: return []
 
+AUTOCOMPLETE_LIMIT = 8
+AUTOCOMPLETE_MIN_PREFIX = 2
+
+def _matches_prefix(name, prefix):
+    """True if the artist name, or any later word of it, starts with prefix."""
+    words = name.lower().split()
+    return any(" ".join(words[i:]).startswith(prefix) for i in range(len(words)))
+
 def get_suggestions(query):
+    """
+    Typeahead suggestions. Resolution order (upstream only on a true miss):
+    1. Redis query cache for this exact (normalised) query
+    2. Cached results of a shorter prefix, filtered down to this query, if that list was
+       complete (under AUTOCOMPLETE_LIMIT); a full list may have cut off matches
+    3. Lexicographic prefix index of every artist seen so far, if it fills the limit
+    4. Live Genius search (result cached + indexed)
+    """
+    from app.cache_handler import (
+        get_autocomplete_cache, set_autocomplete_cache,
+        index_autocomplete_artists, search_autocomplete_index
+    )
+
+    q = " ".join((query or "").lower().split())
+    if not q: return []
+
+    cached = get_autocomplete_cache(q)
+    if cached is not None:
+        return cached
+
+    for k in range(len(q) - 1, AUTOCOMPLETE_MIN_PREFIX - 1, -1):
+        shorter = get_autocomplete_cache(q[:k])
+        if shorter:
+            if len(shorter) >= AUTOCOMPLETE_LIMIT:
+                break # Truncated list: narrowing it could drop artists Genius would return
+            narrowed = [a for a in shorter if _matches_prefix(a["name"], q)]
+            if narrowed:
+                set_autocomplete_cache(q, narrowed, ttl=3600)
+                return narrowed
+            break # Nearest cached prefix has nothing for this query
+
+    indexed = search_autocomplete_index(q, AUTOCOMPLETE_LIMIT)
+    if len(indexed) >= AUTOCOMPLETE_LIMIT:
+        set_autocomplete_cache(q, indexed, ttl=3600)
+        return indexed
+
+    results = _fetch_suggestions(query)
+    if results is None:
+        return [] # Upstream failed or timed out: nothing cached, the next keystroke retries
+    if results:
+        set_autocomplete_cache(q, results)
+        index_autocomplete_artists(results)
+    else:
+        set_autocomplete_cache(q, [], ttl=300) # Short negative entry for dead-end queries
+    return results
+
+def _fetch_suggestions(query):
+    """Artist suggestions from a live Genius search, or None if the search itself failed."""
     try:
-        res = requests.get(
-            f"{GENIUS_API_URL}/search",
-            params={"q": query},
-            headers=get_headers(),
-            timeout=5
-        )
-        if res.status_code != 200: return []
-        hits = res.json()["response"]["hits"]
+        hits = genius_search(query, timeout=5)
+        if hits is None: return None
         suggestions = {}
         for hit in hits:
             if hit["type"] == "song":
@@ -94,45 +303,94 @@ def get_suggestions(query):
                         "name": artist["name"],
                         "image_url": artist["image_url"]
                     }
-        return list(suggestions.values())[:8]
+        return list(suggestions.values())[:AUTOCOMPLETE_LIMIT]
     except Exception as e:
         print(f"Suggestion Error: {e}")
-        return []
+        return None
+
+GENIUS_SONGS_PER_PAGE = 50
+# How many discography pages are requested at once after the first one
+GENIUS_PAGE_CONCURRENCY = int(os.getenv("GENIUS_PAGE_CONCURRENCY", 4))
+
+def get_artist_songs_page(artist_id, page=1):
+    """
+    Fetch one page of an artist's songs (sorted by release date).
+    Returns {"songs": [...], "next_page": int | None}, or None if the request failed.
+    """
+    from app.cache_handler import get_artist_songs_cache, set_artist_songs_cache
+
+    cached = get_artist_songs_cache(artist_id, page)
+    if cached is not None:
+        return cached
 
-def get_songs_by_artist(artist_id):
-    songs = []
-    page = 1
     try:
-        while True:
-            print(f"FETCHING SONGS PAGE {page}...")
-            res = requests.get(
-                f"{GENIUS_API_URL}/artists/{artist_id}/songs",
-                params={"sort": "release_date", "per_page": 50, "page": page},
-                headers=get_headers(),
-                timeout=20
-            )
-            if res.status_code != 200: break
-            data = res.json()["response"]
-            items = data["songs"]
-            if not items: break
-            for s in items:
-                alb = s.get("primary_album")
-                songs.append({
-                    "id": s["id"],
-                    "title": s["title"],
-                    "image": s["song_art_image_thumbnail_url"],
-                    "album": alb["name"] if alb else None,
-                    "date": s.get("release_date_for_display")
-                })
-            if not data.get("next_page"): break
-            page = data["next_page"]
-        print(f"TOTAL SONGS FETCHED: {len(songs)}")
-        return songs
-    except: return songs
+        print(f"FETCHING SONGS PAGE {page}...")
+        res = http_handler.get(
+            f"{GENIUS_API_URL}/artists/{artist_id}/songs",
+            params={"sort": "release_date", "per_page": GENIUS_SONGS_PER_PAGE, "page": page},
+            headers=get_headers(),
+            timeout=20
+        )
+        if res.status_code != 200: return None
+        data = res.json()["response"]
+        songs = []
+        for s in data["songs"]:
+            alb = s.get("primary_album")
+            songs.append({
+                "id": s["id"],
+                "title": s["title"],
+                "image": s["song_art_image_thumbnail_url"],
+                "album": alb["name"] if alb else None,
+                "date": s.get("release_date_for_display")
+            })
+        result = {"songs": songs, "next_page": data.get("next_page")}
+        set_artist_songs_cache(artist_id, result, page, ttl=3600)
+        return result
+    except Exception as e:
+        print(f"GENIUS SONGS PAGE {page} ERROR: {e}")
+        return None
+
+def get_songs_by_artist(artist_id):
+    """
+    Full discography for an artist, cached in Redis.
+    Page 1 is fetched first; remaining pages are requested GENIUS_PAGE_CONCURRENCY at a time
+    until a page comes back empty or without a next_page.
+    """
+    from app.cache_handler import get_artist_songs_cache, set_artist_songs_cache
+
+    cached = get_artist_songs_cache(artist_id)
+    if cached is not None:
+        return cached
+
+    first = get_artist_songs_page(artist_id, 1)
+    if not first: return []
+    songs = list(first["songs"])
+    next_page = first.get("next_page")
+    complete = True
+
+    with ThreadPoolExecutor(max_workers=GENIUS_PAGE_CONCURRENCY) as pool:
+        while next_page:
+            window = list(range(next_page, next_page + GENIUS_PAGE_CONCURRENCY))
+            results = list(pool.map(lambda p: get_artist_songs_page(artist_id, p), window))
+            next_page = None
+            for result in results:
+                if result is None:
+                    complete = False
+                    break
+                songs.extend(result["songs"])
+                if not result["songs"] or not result.get("next_page"):
+                    break
+                next_page = result["next_page"]
+
+    print(f"TOTAL SONGS FETCHED: {len(songs)}")
+    # Don't pin a partial discography for a whole day
+    if complete:
+        set_artist_songs_cache(artist_id, songs)
+    return songs
 
 def get_lyrics_by_id(song_id):
     try:
-        res = requests.get(
+        res = http_handler.get(
             f"{GENIUS_API_URL}/songs/{song_id}",
             headers=get_headers(),
             timeout=5
@@ -152,27 +410,8 @@ def get_lyrics_by_id(song_id):
             print("FAILED TO RETRIEVE LYRICS HTML.")
             return None
 
-        soup = BeautifulSoup(html, "html.parser")
-        
-        containers = soup.select("div[data-lyrics-container]")
-        all_lines = []
-        
-        for c in containers:
-            if "translation" in c.get_text().lower(): continue
-            for br in c.find_all("br"): br.replace_with("\n")
-            block = c.get_text("\n").strip()
-            if block: 
-                lines = block.split("\n")
-                for line in lines:
-                    stripped = line.strip()
-                    if stripped: all_lines.append(stripped)
-                    else: all_lines.append("") 
-
-        lyrics_raw = "\n".join(all_lines)
-        
-        if not lyrics_raw.strip():
-            old = soup.find("div", class_="lyrics")
-            if old: lyrics_raw = old.get_text("\n")
+        # Fast C-backed extraction (selectolax/lxml), BeautifulSoup as fallback
+        lyrics_raw = extract_lyrics_html(html)
 
         if not lyrics_raw.strip():
             print("PARSING ERROR: LYRICS CONTENT EMPTY.")
@@ -193,25 +432,43 @@ import urllib.parse
 
 def fetch_lrclib_lyrics(track_name, artist_name):
     """Fetch lyrics using the free and open LRCLib API (No scraping needed)"""
+    return _lrclib_lookup(track_name, artist_name)[0]
+
+def _lrclib_lookup(track_name, artist_name):
+    """
+    LRCLib lookup reporting whether LRCLib actually answered.
+    Returns (lyrics, answered): answered is False on timeouts, errors and unexpected statuses.
+    """
+    # Local LRCLib dump copy first (no network, sub-millisecond when ingested)
+    local = get_local_lyrics(track_name, artist_name)
+    if local:
+        print(f"LRCLIB LOCAL: Hit for '{track_name}' by '{artist_name}'")
+        return local, True
     try:
         # LRCLib is highly optimized for "Track Name - Artist Name" matching
         t_clean = track_name.split(" - ")[0].split(" (")[0].strip()
         url = f"https://lrclib.net/api/get?artist_name={urllib.parse.quote(artist_name)}&track_name={urllib.parse.quote(t_clean)}"
-        res = requests.get(url, timeout=3) # Shorter timeout
+        res = http_handler.get(url, timeout=3, retries=0) # Shorter timeout, raced: no retries
         if res.status_code == 200:
             data = res.json()
             if data and data.get("plainLyrics"):
                 print(f"LRCLIB: Success for '{t_clean}' by '{artist_name}'")
-                return data["plainLyrics"]
+                return data["plainLyrics"], True
+            return None, True # Known track without plain lyrics
+        return None, res.status_code == 404
     except Exception as e:
         print(f"LRCLIB ERROR: {e}")
-    return None
+    return None, False
 
 def search_google_lyrics(track_name, artist_name):
     """
     Emergency Fallback: Search Google for lyrics snippets if other sources fail.
     Uses basic scraping (best effort).
     """
+    return _google_lookup(track_name, artist_name)[0]
+
+def _google_lookup(track_name, artist_name):
+    """search_google_lyrics returning (lyrics, answered); answered is False if Google couldn't be queried."""
     try:
         query = f"{track_name} {artist_name} lyrics"
         url = f"https://www.google.com/search?q={urllib.parse.quote(query)}"
@@ -219,7 +476,7 @@ def search_google_lyrics(track_name, artist_name):
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
         }
         print(f"GOOGLE SEARCH FALLBACK: Searching for '{query}'")
-        res = requests.get(url, headers=headers, timeout=2)
+        res = http_handler.get(url, headers=headers, timeout=2, retries=0)
         
         if res.status_code == 200:
             # Look for lyrics in Google's structured snippets or common sites
@@ -234,16 +491,72 @@ def search_google_lyrics(track_name, artist_name):
             
             lyrics_card = soup.find("div", {"data-lyricid": True})
             if lyrics_card:
-                return lyrics_card.get_text("\n")
+                return lyrics_card.get_text("\n"), True
             
             # Fallback 2: Check for specific spans or divs that Google uses for lyrics
             # Note: This is highly variant. 
             container = soup.find("div", class_="PZPZ5b") # Common container for knowledge cards
             if container:
-                return container.get_text("\n")
+                return container.get_text("\n"), True
+            return None, True
                 
     except Exception as e:
         print(f"GOOGLE SEARCH ERROR: {e}")
+    return None, False
+
+def clean_audio_filename(filename):
+    """Turn an audio filename into a search query: drop the extension and common downloader prefixes."""
+    # Remove extension
+    clean_name = re.sub(r'\.[^/.]+$', '', filename).strip()
+    # Remove common downloader prefixes
+    clean_name = re.sub(r'^(SpotiDownloader\.com\s*-\s*|\[.*?\]\s*-\s*|y2mate\.com\s*-\s*)', '', clean_name, flags=re.IGNORECASE).strip()
+    # Clean up hyphen spacing for better Genius search
+    return clean_name.replace(" - ", " ")
+
+def resolve_lyrics_by_filename(filename):
+    """
+    Lyrics for an uploaded audio file, guessed from its filename.
+    Walks Genius song hits (skipping playlist/tracklist pages), trying
+    Genius scrape -> LRCLib -> Google for each. Returns lyrics or None.
+    """
+    query_name = clean_audio_filename(filename)
+
+    # Direct Genius Search (Flexible, handles any order)
+    try:
+        hits = genius_search(query_name, timeout=5)
+        if hits is not None:
+            for hit in hits:
+                if hit["type"] == "song":
+                    result = hit["result"]
+                    title = result.get("title", "").lower()
+                    artist = result.get("primary_artist", {}).get("name", "").lower()
+                    
+                    # Skip garbage playlist/tracklist hits
+                    if any(x in artist for x in ["spotify", "genius", "apple music", "various"]):
+                        continue
+                    if any(x in title for x in ["tracklist", "setlist", "playlist", "singles"]):
+                        continue
+                        
+                    song_id = result["id"]
+                    
+                    # 1. Try Genius Web Scraping
+                    lyrics_data = get_lyrics_by_id(song_id)
+                    if lyrics_data and lyrics_data.get("lyrics"):
+                        return lyrics_data["lyrics"]
+                        
+                    # 2. If Genius scraping is blocked (e.g. on Vercel), Fallback to LRCLib
+                    lrc = fetch_lrclib_lyrics(title, artist)
+                    if lrc:
+                        return lrc
+                        
+                    # 3. Last Resort Fallback: Google Search
+                    ggl = search_google_lyrics(title, artist)
+                    if ggl:
+                        return ggl
+                        
+    except Exception as e:
+        print(f"Direct Genius Search Error: {e}")
+
     return None
 
 def is_cjk(text):
@@ -254,46 +567,191 @@ def search_track_lyrics(track_name, artist_name):
     """
     Flow: LRCLib (Fast) -> Genius (Primary) -> Google (Last Resort)
     """
-    # 1. Try LRCLib First
-    lrclib_lyrics = fetch_lrclib_lyrics(track_name, artist_name)
-    if lrclib_lyrics:
-        return lrclib_lyrics
-
-    # Fast Skip for CJK tracks if Genius is likely to fail/hang
-    # Genius scraping via proxy often hangs on non-latin tracks
-    is_asian = is_cjk(track_name) or is_cjk(artist_name)
-    
-    # 2. Fallback to Genius (Only if not Asian or after short attempt)
+    return resolve_track_lyrics(track_name, artist_name)[0]
+
+# Negative ("no lyrics found") entries back off exponentially: 6h, 12h, 24h ... capped at 7 days.
+LYRICS_MISS_BACKOFF = int(os.getenv("LYRICS_MISS_BACKOFF", 21600))
+LYRICS_MISS_MAX_BACKOFF = int(os.getenv("LYRICS_MISS_MAX_BACKOFF", 604800))
+
+def resolve_track_lyrics(track_name, artist_name):
+    """
+    Same flow as search_track_lyrics, but also reports which source answered.
+    Returns (lyrics, source) where source is "lrclib", "genius", "google" or None.
+
+    Lookup order: Redis lyrics:* -> Postgres track_lyrics -> upstream scrape.
+    Scrape results (including misses) are written back to both tiers.
+    """
+    from app.cache_handler import canonical_track_key, get_lyrics_cache, set_lyrics_cache
+    from app.db_handler import get_track_lyrics, save_track_lyrics, save_track_lyrics_miss
+
+    track_key = canonical_track_key(track_name, artist_name)
+
+    # 1. Redis hot tier
+    cached = get_lyrics_cache(track_key)
+    if cached:
+        if cached.get("lyrics"):
+            return cached["lyrics"], cached.get("source")
+        print(f"LYRICS STORE: Negative cache hit for '{track_key}'")
+        return None, None
+
+    # 2. Durable Postgres tier
+    try:
+        stored = get_track_lyrics(track_key)
+        if stored:
+            if stored["lyrics"]:
+                set_lyrics_cache(track_key, stored["lyrics"], stored["source"])
+                return stored["lyrics"], stored["source"]
+            if stored["retry_in"] > 0:
+                set_lyrics_cache(track_key, None, "none", ttl=stored["retry_in"])
+                return None, None
+    except Exception as e:
+        print(f"LYRICS STORE READ ERROR: {e}")
+
+    # 3. Upstream scrape
+    lyrics, source, definitive = _fetch_track_lyrics(track_name, artist_name)
+    if not lyrics and not definitive:
+        # A source timed out or errored: not a real "not found", so nothing is recorded
+        print(f"LYRICS STORE: Inconclusive lookup for '{track_key}', not caching.")
+        return None, None
+
+    # Postgres and Redis are written independently so one tier being down doesn't starve the other
+    retry_in = LYRICS_MISS_BACKOFF
+    try:
+        if lyrics:
+            save_track_lyrics(track_key, lyrics, source)
+        else:
+            retry_in = save_track_lyrics_miss(track_key, LYRICS_MISS_BACKOFF, LYRICS_MISS_MAX_BACKOFF)
+    except Exception as e:
+        print(f"LYRICS STORE WRITE ERROR: {e}")
+
+    if lyrics:
+        set_lyrics_cache(track_key, lyrics, source)
+    else:
+        set_lyrics_cache(track_key, None, "none", ttl=int(retry_in))
+
+    return lyrics, source
+
+# Racing mode: LRCLib and Genius start together, first acceptable answer wins.
+# Ties are settled by LYRICS_SOURCE_PRIORITY: a lower-priority answer waits up to
+# LYRICS_RACE_GRACE seconds for a higher-priority source that is still in flight.
+LYRICS_RACE_MODE = os.getenv("LYRICS_RACE_MODE", "1") == "1"
+LYRICS_SOURCE_PRIORITY = [s.strip() for s in os.getenv("LYRICS_SOURCE_PRIORITY", "lrclib,genius").split(",") if s.strip()]
+LYRICS_RACE_GRACE = float(os.getenv("LYRICS_RACE_GRACE", 0.3))
+
+_race_pool = ThreadPoolExecutor(max_workers=int(os.getenv("LYRICS_RACE_WORKERS", 8)))
+
+def _fetch_genius_track_lyrics(track_name, artist_name):
+    """
+    Genius search + page scrape for a track. Returns (lyrics, answered).
+    answered is True only for a real answer: lyrics, or a search with no matching song.
+    A failed search or a matching song whose page couldn't be scraped is not an answer.
+    """
     print(f"GENIUS FALLBACK: Searching for '{track_name}' by '{artist_name}'")
     try:
         clean_track = track_name.split(" - ")[0].split(" (")[0].strip()
         # Add "lyrics" to query as requested for better accuracy
         query = f"{clean_track} {artist_name} lyrics"
         
-        res = requests.get(
-            f"{GENIUS_API_URL}/search",
-            params={"q": query},
-            headers=get_headers(),
-            timeout=2 # Fast timeout
-        )
-        if res.status_code == 200:
-            hits = res.json().get("response", {}).get("hits", [])
-            for hit in hits:
-                if hit["type"] == "song":
-                    result = hit["result"]
-                    hit_artist = result.get("primary_artist", {}).get("name", "").lower()
-                    if artist_name.lower() in hit_artist or hit_artist in artist_name.lower():
-                        song_id = result["id"]
-                        lyrics_data = get_lyrics_by_id(song_id)
-                        if lyrics_data and lyrics_data.get("lyrics"):
-                            return lyrics_data["lyrics"]
-                        break # Stop if primary genius result failed
+        hits = genius_search(query, timeout=2, retries=0) # Fast timeout, raced: no retries
+        if hits is None:
+            return None, False
+        for hit in hits:
+            if hit["type"] == "song":
+                result = hit["result"]
+                hit_artist = result.get("primary_artist", {}).get("name", "").lower()
+                if artist_name.lower() in hit_artist or hit_artist in artist_name.lower():
+                    song_id = result["id"]
+                    lyrics_data = get_lyrics_by_id(song_id)
+                    if lyrics_data and lyrics_data.get("lyrics"):
+                        return lyrics_data["lyrics"], True
+                    return None, False # Stop if primary genius result failed
+        return None, True
     except Exception as e:
         print(f"GENIUS TRACK SEARCH ERROR: {e}")
+    return None, False
+
+# Each source returns (lyrics, answered)
+_LYRICS_SOURCES = {
+    "lrclib": _lrclib_lookup,
+    "genius": _fetch_genius_track_lyrics,
+}
+
+def _race_lyrics_sources(track_name, artist_name):
+    """
+    Run every source in LYRICS_SOURCE_PRIORITY concurrently.
+    Returns (lyrics, source, all_answered) for the best answer, or (None, None, all_answered)
+    if none had lyrics. Slower sources are left to finish in the background and their results ignored.
+    """
+    priority = [s for s in LYRICS_SOURCE_PRIORITY if s in _LYRICS_SOURCES]
+    futures = {_race_pool.submit(_LYRICS_SOURCES[s], track_name, artist_name): s for s in priority}
+    pending = set(futures)
+    results = {}
+    all_answered = True
+    deadline = None
+
+    while pending:
+        timeout = None if deadline is None else max(0, deadline - time.monotonic())
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            break # Grace window expired, settle with what we have
+
+        for f in done:
+            try:
+                lyrics, answered = f.result()
+            except Exception as e:
+                print(f"LYRICS RACE ERROR ({futures[f]}): {e}")
+                lyrics, answered = None, False
+            all_answered = all_answered and answered
+            if lyrics:
+                results[futures[f]] = lyrics
+
+        # Winner = first source in priority order that answered, provided no
+        # higher-priority source is still running.
+        running = {futures[f] for f in pending}
+        for s in priority:
+            if s in results:
+                print(f"LYRICS RACE: '{s}' won for '{track_name}' by '{artist_name}'")
+                return results[s], s, all_answered
+            if s in running:
+                break
+
+        if results and deadline is None:
+            deadline = time.monotonic() + LYRICS_RACE_GRACE
+
+    for f in pending:
+        f.cancel()
+    if pending:
+        all_answered = False
+    for s in priority:
+        if s in results:
+            return results[s], s, all_answered
+    return None, None, all_answered
+
+def _fetch_track_lyrics(track_name, artist_name):
+    """
+    Scrape lyrics from upstream sources. Returns (lyrics, source, definitive) or (None, None, definitive).
+    definitive is True only when every source consulted gave a real answer, i.e. a miss is a genuine "not found".
+    """
+    if LYRICS_RACE_MODE:
+        # 1+2. LRCLib and Genius raced concurrently
+        lyrics, source, definitive = _race_lyrics_sources(track_name, artist_name)
+        if lyrics:
+            return lyrics, source, True
+    else:
+        # 1. Try LRCLib First
+        lrclib_lyrics, lrclib_answered = _lrclib_lookup(track_name, artist_name)
+        if lrclib_lyrics:
+            return lrclib_lyrics, "lrclib", True
+
+        # 2. Fallback to Genius
+        genius_lyrics, genius_answered = _fetch_genius_track_lyrics(track_name, artist_name)
+        if genius_lyrics:
+            return genius_lyrics, "genius", True
+        definitive = lrclib_answered and genius_answered
 
-    # 3. Last Resort: Google Search (If not already skipped)
-    google_lyrics = search_google_lyrics(track_name, artist_name)
+    # 3. Last Resort: Google Search (only once LRCLib and Genius both failed)
+    google_lyrics, google_answered = _google_lookup(track_name, artist_name)
     if google_lyrics:
-        return clean_lyrics(google_lyrics)
+        return clean_lyrics(google_lyrics), "google", True
 
-    return None
\ No newline at end of file
+    return None, None, definitive and google_answered
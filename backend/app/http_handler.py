@@ -0,0 +1,296 @@
+import os
+import time
+import hashlib
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Shared outbound HTTP client.
+# One requests.Session per upstream host so TCP/TLS connections are kept alive and reused
+# across requests (Spotify, Last.fm, Genius, LRCLib, HF Space, QStash, Upstash ...).
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 20))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3.05))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 10))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 2))
+# Upper bound for a single backoff sleep between retries (seconds)
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", 1.0))
+
+_LATENCY_WINDOW = 200
+
+# Shared rate limiting: one Redis token bucket per (upstream, credential), used by every worker and
+# serverless instance, so concurrent syncs together stay under each upstream's limit.
+# host -> (upstream, requests per second, burst, env var holding the credential the limit applies to)
+RATE_LIMITS = {
+    "ws.audioscrobbler.com": ("lastfm", float(os.getenv("LASTFM_RATE_LIMIT", 5)), 10, "LASTFM_API_KEY"),
+    "api.spotify.com": ("spotify", float(os.getenv("SPOTIFY_RATE_LIMIT", 10)), 20, "SPOTIFY_CLIENT_ID"),
+    "api.genius.com": ("genius", float(os.getenv("GENIUS_RATE_LIMIT", 5)), 10, "GENIUS_ACCESS_TOKEN"),
+    "genius.com": ("genius-web", float(os.getenv("GENIUS_WEB_RATE_LIMIT", 3)), 6, None),
+}
+# Longest a call waits for a token (or for a Retry-After block) before giving up
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", 10))
+# Same bound for latency-bound calls (retries=0), which would rather fail than queue
+RATE_LIMIT_FAST_WAIT = float(os.getenv("RATE_LIMIT_FAST_WAIT", 0.5))
+
+# KEYS: bucket hash, block key (set from Retry-After). ARGV: rate/sec, burst.
+# Returns 0 when a token was taken, otherwise milliseconds to wait. Uses the Redis clock,
+# so instances with skewed clocks still share one consistent bucket.
+_TOKEN_BUCKET_LUA = """
+local blocked = redis.call('PTTL', KEYS[2])
+if blocked > 0 then return blocked end
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return wait
+"""
+
+class RateLimitExceeded(requests.exceptions.RequestException):
+    """Raised when no token (or Retry-After window) frees up within the caller's max wait."""
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_metrics = {}
+_metrics_lock = threading.Lock()
+_limiter_metrics = {}
+_limiter_script = None
+
+def _build_retry(retries):
+    # Retries only on connection failures and gateway errors.
+    # Read/status retries are limited to idempotent methods so a POST is never replayed
+    # after the upstream may already have processed it.
+    # Backoff sleeps are capped and a gateway's Retry-After is ignored, so retries can't
+    # stretch a call far past its timeout (429 Retry-After is handled by the rate limiter).
+    kwargs = dict(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=retries,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD", "OPTIONS"]),
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    try:
+        return Retry(backoff_max=HTTP_BACKOFF_MAX, **kwargs) # urllib3 >= 2
+    except TypeError:
+        retry = Retry(**kwargs)
+        retry.BACKOFF_MAX = HTTP_BACKOFF_MAX # urllib3 1.26
+        return retry
+
+def _build_session(retries=HTTP_MAX_RETRIES):
+    retry = _build_retry(retries)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_session(host, retries=None):
+    """
+    Return the keep-alive session dedicated to an upstream host.
+    retries overrides HTTP_MAX_RETRIES (one pooled session per host and retry count).
+    """
+    key = (host, HTTP_MAX_RETRIES if retries is None else retries)
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _build_session(key[1])
+                _sessions[key] = session
+    return session
+
+def _record(host, elapsed_ms, status_code=None, error=None):
+    with _metrics_lock:
+        m = _metrics.get(host)
+        if m is None:
+            m = {"requests": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+                 "last_error": None, "latencies": deque(maxlen=_LATENCY_WINDOW)}
+            _metrics[host] = m
+        m["requests"] += 1
+        m["total_ms"] += elapsed_ms
+        m["max_ms"] = max(m["max_ms"], elapsed_ms)
+        m["latencies"].append(elapsed_ms)
+        if error is not None or (status_code is not None and status_code >= 500):
+            m["errors"] += 1
+            m["last_error"] = str(error) if error is not None else f"HTTP {status_code}"
+
+# --- RATE LIMITER ---
+
+def _limiter_for(host):
+    """(bucket name, rate, burst) for a rate-limited host, or None."""
+    config = RATE_LIMITS.get(host)
+    if not config:
+        return None
+    upstream, rate, burst, credential_env = config
+    credential = os.getenv(credential_env, "") if credential_env else ""
+    # Never put the credential itself in a Redis key
+    digest = hashlib.sha1(credential.encode("utf-8")).hexdigest()[:12] if credential else "anon"
+    return f"{upstream}:{digest}", rate, burst
+
+def _limiter_stat(name, field, amount=1):
+    with _metrics_lock:
+        m = _limiter_metrics.setdefault(name, {
+            "acquired": 0, "throttled": 0, "wait_ms": 0.0, "rejected": 0,
+            "upstream_429": 0, "redis_errors": 0, "last_retry_after": None
+        })
+        m[field] += amount
+
+def _acquire(limiter, max_wait=RATE_LIMIT_MAX_WAIT):
+    """Block until the shared bucket grants a token; raises RateLimitExceeded after max_wait seconds."""
+    global _limiter_script
+    name, rate, burst = limiter
+    deadline = time.monotonic() + max_wait
+    waited = 0.0
+    while True:
+        try:
+            from app.cache_handler import r
+            if _limiter_script is None:
+                _limiter_script = r.register_script(_TOKEN_BUCKET_LUA)
+            wait_ms = int(_limiter_script(keys=[f"ratelimit:{name}", f"ratelimit:block:{name}"], args=[rate, burst]))
+        except Exception as e:
+            # Redis unavailable: fail open rather than stall every outbound call
+            print(f"HTTP RATE LIMITER ERROR ({name}): {e}")
+            _limiter_stat(name, "redis_errors")
+            return
+        if wait_ms <= 0:
+            _limiter_stat(name, "acquired")
+            if waited:
+                _limiter_stat(name, "throttled")
+                _limiter_stat(name, "wait_ms", waited * 1000)
+            return
+        if time.monotonic() + wait_ms / 1000 > deadline:
+            _limiter_stat(name, "rejected")
+            raise RateLimitExceeded(f"Rate limit for {name} not available within {max_wait}s")
+        time.sleep(wait_ms / 1000)
+        waited += wait_ms / 1000
+
+def _retry_after_seconds(res):
+    """Retry-After as seconds (delta-seconds or HTTP-date); 1s when the upstream sends none."""
+    value = res.headers.get("Retry-After")
+    if not value:
+        return 1.0
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except Exception:
+        return 1.0
+
+def _block(limiter, seconds):
+    """Pause the shared bucket for every instance until the upstream's Retry-After has passed."""
+    name = limiter[0]
+    _limiter_stat(name, "upstream_429")
+    with _metrics_lock:
+        _limiter_metrics[name]["last_retry_after"] = seconds
+    try:
+        from app.cache_handler import r
+        r.set(f"ratelimit:block:{name}", "1", px=max(int(seconds * 1000), 1))
+    except Exception as e:
+        print(f"HTTP RATE LIMITER ERROR ({name}): {e}")
+        _limiter_stat(name, "redis_errors")
+
+def request(method, url, timeout=None, retries=None, **kwargs):
+    """
+    Drop-in replacement for requests.request() routed through the per-host pool.
+    Applies (connect, read) default timeouts when the caller does not pass one.
+    Latency-bound callers pass retries=0 so the call costs at most one timeout
+    (no transport retries, no 429 retry, and at most RATE_LIMIT_FAST_WAIT queued for a token).
+    Rate-limited hosts (RATE_LIMITS) take a token from the shared bucket first; a 429 blocks the
+    bucket for its Retry-After and idempotent requests are retried once when that fits in RATE_LIMIT_MAX_WAIT.
+    """
+    host = urlparse(url).netloc
+    if timeout is None:
+        timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    limiter = _limiter_for(host)
+    attempts = 2 if limiter and retries != 0 and method.upper() in ("GET", "HEAD", "OPTIONS") else 1
+    max_wait = RATE_LIMIT_FAST_WAIT if retries == 0 else RATE_LIMIT_MAX_WAIT
+
+    for attempt in range(attempts):
+        if limiter:
+            _acquire(limiter, max_wait)
+        start = time.perf_counter()
+        try:
+            res = get_session(host, retries).request(method, url, timeout=timeout, **kwargs)
+        except Exception as e:
+            _record(host, (time.perf_counter() - start) * 1000, error=e)
+            raise
+        _record(host, (time.perf_counter() - start) * 1000, status_code=res.status_code)
+
+        if res.status_code != 429 or not limiter:
+            return res
+        retry_after = _retry_after_seconds(res)
+        _block(limiter, retry_after)
+        print(f"HTTP 429 from {host}: backing off {retry_after:.1f}s")
+        if retry_after > RATE_LIMIT_MAX_WAIT:
+            break
+    return res
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+def head(url, **kwargs):
+    return request("HEAD", url, **kwargs)
+
+def get_http_metrics():
+    """Per-host request count, error count/rate and latency (avg, p50, p95, max in ms)."""
+    report = {}
+    with _metrics_lock:
+        for host, m in _metrics.items():
+            lat = sorted(m["latencies"])
+            n = m["requests"]
+            report[host] = {
+                "requests": n,
+                "errors": m["errors"],
+                "error_rate": round(m["errors"] / n, 4) if n else 0,
+                "avg_ms": round(m["total_ms"] / n, 1) if n else 0,
+                "p50_ms": round(lat[len(lat) // 2], 1) if lat else 0,
+                "p95_ms": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))], 1) if lat else 0,
+                "max_ms": round(m["max_ms"], 1),
+                "last_error": m["last_error"],
+            }
+    return report
+
+def get_rate_limit_metrics():
+    """Per-bucket limiter counters for this instance, plus the configured rate/burst."""
+    configured = {}
+    for host in RATE_LIMITS:
+        limiter = _limiter_for(host)
+        configured[limiter[0]] = {"host": host, "rate_per_sec": limiter[1], "burst": limiter[2]}
+    with _metrics_lock:
+        report = {}
+        for name, config in configured.items():
+            m = dict(_limiter_metrics.get(name, {}))
+            if m.get("wait_ms"):
+                m["wait_ms"] = round(m["wait_ms"], 1)
+            report[name] = {**config, **m}
+        return report
+
+def reset_http_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+        _limiter_metrics.clear()
@@ -0,0 +1,127 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Async multi-provider resolution engine (used for artist/track images).
+# Each item is looked up across an ordered list of providers. The top provider starts at once,
+# each lower one starts HEDGE_DELAY seconds later (or immediately once everything above it has failed),
+# and the first answer whose higher-priority providers have all finished wins; the rest are cancelled.
+# Provider calls are blocking (http_handler), so they run on a shared worker pool behind
+# per-provider token buckets that every concurrent resolution in this process shares.
+
+IMAGE_RESOLVER_WORKERS = int(os.getenv("IMAGE_RESOLVER_WORKERS", 16))
+IMAGE_RESOLVER_HEDGE_DELAY = float(os.getenv("IMAGE_RESOLVER_HEDGE_DELAY", 0.4))
+
+_pool = ThreadPoolExecutor(max_workers=IMAGE_RESOLVER_WORKERS)
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, up to `burst` banked."""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _take(self):
+        """Consume a token if available; otherwise return seconds until one is."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def get_bucket(provider, rate, burst):
+    """Process-wide bucket per provider (first caller's limits win)."""
+    with _buckets_lock:
+        if provider not in _buckets:
+            _buckets[provider] = TokenBucket(rate, burst)
+        return _buckets[provider]
+
+async def _call_provider(provider, args):
+    name, fn, rate, burst = provider
+    await get_bucket(name, rate, burst).acquire()
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_pool, lambda: fn(*args))
+    except Exception as e:
+        print(f"IMAGE RESOLVER: {name} failed: {e}")
+        return None
+
+async def resolve_first(providers, args, accept=bool):
+    """
+    Run providers (list of (name, fn, rate_per_sec, burst)) for one item under the priority policy.
+    Returns (provider_name, value, results) where results holds the answer of every provider
+    that finished, or (None, None, results) if nothing acceptable came back.
+    """
+    tasks = [None] * len(providers)
+    started_at = time.monotonic()
+
+    def collect():
+        return {p[0]: t.result() for p, t in zip(providers, tasks)
+                if t is not None and t.done() and not t.cancelled()}
+
+    def start_due():
+        elapsed = time.monotonic() - started_at
+        for i, p in enumerate(providers):
+            if tasks[i] is not None: continue
+            higher_all_done = all(t is not None and t.done() for t in tasks[:i])
+            if i == 0 or higher_all_done or elapsed >= i * IMAGE_RESOLVER_HEDGE_DELAY:
+                tasks[i] = asyncio.ensure_future(_call_provider(p, args))
+
+    try:
+        while True:
+            start_due()
+            # Winner: first acceptable answer with every higher-priority provider finished
+            for i, p in enumerate(providers):
+                t = tasks[i]
+                if t is None or not t.done():
+                    break
+                value = t.result()
+                if accept(value):
+                    return p[0], value, collect()
+            else:
+                return None, None, collect() # All finished, nothing acceptable
+
+            running = [t for t in tasks if t is not None and not t.done()]
+            pending_starts = [i for i, t in enumerate(tasks) if t is None]
+            timeout = None
+            if pending_starts:
+                next_start = started_at + pending_starts[0] * IMAGE_RESOLVER_HEDGE_DELAY
+                timeout = max(0, next_start - time.monotonic())
+            if running:
+                await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            elif timeout:
+                await asyncio.sleep(timeout)
+    finally:
+        for t in tasks:
+            if t is not None and not t.done():
+                t.cancel()
+
+def run_async(coro):
+    """
+    Run a coroutine to completion from sync code, even if this thread already has a running
+    event loop (e.g. called from an async route): in that case it runs on a fresh loop in a helper thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        return ex.submit(asyncio.run, coro).result()
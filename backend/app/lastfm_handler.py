@@ -1,9 +1,11 @@
 import os
 import requests
+from app import http_handler
 import hashlib
-import base64
 import time
-from urllib.parse import quote_plus
+import uuid
+from urllib.parse import quote_plus, urlparse
+import asyncio
 from concurrent.futures import ThreadPoolExecutor
 from app.db_handler import (
     save_user,
@@ -18,11 +20,22 @@ from app.cache_handler import (
     is_bad_image, 
     set_image_cache, 
     delete_image_cache, 
-    get_image_cache,
+    get_image_cache_entry,
+    get_track_image_cache,
+    set_track_image_cache,
+    canonical_track_key,
+    get_lastfm_user_info_cache,
+    set_lastfm_user_info_cache,
+    get_lastfm_enhance_input,
+    set_lastfm_enhance_input,
+    delete_lastfm_enhance_input,
     acquire_analysis_lock,
-    release_analysis_lock
+    release_analysis_lock,
+    IMAGE_CACHE_TTL
 )
 from app.mongo_handler import save_user_sync
+from app.spotify_handler import get_spotify_app_token
+from app.image_resolver import resolve_first, run_async
 from app.nlp_handler import generate_sentiment_analysis
 from fastapi import BackgroundTasks
 
@@ -51,7 +64,7 @@ def _search_spotify_artist_image(artist_name, token):
         # Get more results to find closer name match
         url = f"https://api.spotify.com/v1/search?q=artist:%22{quote_plus(artist_name)}%22&type=artist&limit=5"
         headers = {"Authorization": f"Bearer {token}"}
-        res = requests.get(url, headers=headers, timeout=5)
+        res = http_handler.get(url, headers=headers, timeout=5)
         if res.status_code == 200:
             data = res.json()
             items = data.get("artists", {}).get("items", [])
@@ -67,142 +80,350 @@ def _search_spotify_artist_image(artist_name, token):
     except: pass
     return ""
 
-def _is_valid_image(url: str) -> bool:
-    """Enhanced validation: check for placeholders and minimum size (proxy via Content-Length)."""
+# CDNs that only ever serve real artwork at these URLs; no HEAD probe needed
+TRUSTED_IMAGE_HOSTS = (
+    "i.scdn.co",          # Spotify
+    "mosaic.scdn.co",
+    "image-cdn-ak.spotifycdn.com",
+    "image-cdn-fa.spotifycdn.com",
+    "dzcdn.net",          # Deezer (e-cdns-images / cdn-images)
+    "mzstatic.com",       # iTunes
+)
+# Cached images are re-probed at most this often. Kept below the img:* TTL, otherwise
+# entries expire before they are ever old enough to be revalidated.
+IMAGE_REVALIDATE_INTERVAL = min(
+    int(os.getenv("IMAGE_REVALIDATE_INTERVAL", IMAGE_CACHE_TTL // 2)), # 3.5 days
+    IMAGE_CACHE_TTL - 3600
+)
+
+def _is_trusted_image_host(url):
+    host = urlparse(url).netloc.lower()
+    return any(host == h or host.endswith("." + h) for h in TRUSTED_IMAGE_HOSTS)
+
+def _check_image(url):
+    """
+    Validate an image URL. Returns (ok, size_in_bytes or None).
+    Trusted CDN URLs are accepted without a network probe.
+    """
     if not url or is_bad_image(url):
-        return False
-    # Only test size for valid-looking Last.fm/Spotify/Deezer images
+        return False, None
+    if _is_trusted_image_host(url):
+        return True, None
     try:
         # Avoid heavy download; checking headers only
-        res = requests.head(url, timeout=3, allow_redirects=True)
+        res = http_handler.head(url, timeout=3, allow_redirects=True)
         # If Content-Length is provided, ensure it's > ~3000 bytes (rough proxy for 300x300 min)
         # We use 3000 bytes as a low threshold to discard 1x1 pixels or tiny icons.
         size = res.headers.get('Content-Length')
         if size and int(size) < 3000:
-            return False
-        return True
+            return False, int(size)
+        return True, int(size) if size else None
     except Exception:
         # If HEAD fails or timeouts, we accept it cautiously
-        return True
+        return True, None
 
-# --- BACKGROUND PROCESSING ---
+def _is_valid_image(url: str) -> bool:
+    """Enhanced validation: check for placeholders and minimum size (proxy via Content-Length)."""
+    return _check_image(url)[0]
 
-def process_lastfm_enhancement_background(username, time_range, result, extended=False, force_sync=False, sync_id=None):
-    """
-    Background task to enhance Last.fm data with Spotify metadata,
-    artist tags (genres), and sentiment analysis.
-    """
+def _scrape_lastfm_artist_image(artist_name):
+    """Robust Last.fm scraper using LD+JSON and flexible meta tags."""
+    import re, json, html
+    from urllib.parse import unquote
     try:
-        def _scrape_lastfm_artist_image(artist_name):
-            """Robust Last.fm scraper using LD+JSON and flexible meta tags."""
-            import re, json, html
-            from urllib.parse import unquote
-            try:
-                url = f"https://www.last.fm/music/{quote_plus(artist_name)}"
-                headers = {
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
-                    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
-                    "Accept-Language": "en-US,en;q=0.5"
-                }
-                res = requests.get(url, headers=headers, timeout=5)
-                if res.status_code != 200:
-                    return ""
-                
-                res_html = res.text
-                
-                # 1. Try LD+JSON (Most reliable)
-                try:
-                    ld_json_matches = re.findall(r'<script type="application/ld\+json">(.*?)</script>', res_html, re.DOTALL)
-                    for ld_text in ld_json_matches:
-                        data = json.loads(ld_text)
-                        if isinstance(data, dict):
-                            items = data if isinstance(data, list) else [data]
-                            for item in items:
-                                if item.get("@type") == "MusicGroup" and item.get("image"):
-                                    return html.unescape(item["image"])
-                except: pass
-
-                # 2. Flexible Meta Tag Search
-                meta_patterns = [
-                    r'<meta[^>]+(?:property|name)=["\'](?:og:image|twitter:image)["\'][^>]+content=["\']([^"\']+)["\']',
-                    r'<meta[^>]+content=["\']([^"\']+)["\'][^>]+(?:property|name)=["\'](?:og:image|twitter:image)["\']'
-                ]
-                
-                for pattern in meta_patterns:
-                    matches = re.findall(pattern, res_html, re.IGNORECASE)
-                    for img_url in matches:
-                        clean_url = html.unescape(img_url)
-                        # Filter out placeholders & generics
-                        poisoned = ["2a96cbd8b46e442fc41c2b86b821562f", "avatar", "default_artist", "lastfm_logo", "placeholder"]
-                        if not any(p in clean_url for p in poisoned):
-                            return clean_url
-                            
-            except Exception as e:
-                print(f"SCRAPE ERROR for {artist_name}: {e}")
+        url = f"https://www.last.fm/music/{quote_plus(artist_name)}"
+        headers = {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+            "Accept-Language": "en-US,en;q=0.5"
+        }
+        res = http_handler.get(url, headers=headers, timeout=5)
+        if res.status_code != 200:
             return ""
 
-        def _scrape_lastfm_track_image(track_name, artist_name):
-            """Fallback scraper to get track image from last.fm website without API limits."""
-            from app.cache_handler import get_image_cache, set_image_cache
-            cache_key = f"{artist_name}__{track_name}"
-            cached_img = get_image_cache(cache_key)
-            if cached_img:
-                return "" if cached_img == "__NOT_FOUND__" else cached_img
+        res_html = res.text
 
-            import re
-            try:
-                url = f"https://www.last.fm/music/{quote_plus(artist_name)}/_/{quote_plus(track_name)}"
-                headers = {
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
-                    "Accept-Language": "en-US,en;q=0.5"
-                }
-                res = requests.get(url, headers=headers, timeout=5)
-                if res.status_code == 200:
-                    matches = re.findall(r'<meta\s+(?:property|name)=[\'"](?:og:image|twitter:image)[\'"]\s+content=[\'"]([^\'"]+)[\'"]', res.text)
-                    if not matches:
-                         matches = re.findall(r'<meta\s+content=[\'"]([^\'"]+)[\'"]\s+(?:property|name)=[\'"](?:og:image|twitter:image)[\'"]', res.text)
-                    
-                    for img_url in matches:
-                        if "2a96cbd8b46e442fc41c2b86b821562f" not in img_url and "avatar" not in img_url and "default" not in img_url:
-                            set_image_cache(cache_key, img_url)
-                            return img_url
-            except Exception:
-                pass
-            return ""
+        # 1. Try LD+JSON (Most reliable)
+        try:
+            ld_json_matches = re.findall(r'<script type="application/ld\+json">(.*?)</script>', res_html, re.DOTALL)
+            for ld_text in ld_json_matches:
+                data = json.loads(ld_text)
+                if isinstance(data, dict):
+                    items = data if isinstance(data, list) else [data]
+                    for item in items:
+                        if item.get("@type") == "MusicGroup" and item.get("image"):
+                            return html.unescape(item["image"])
+        except: pass
+
+        # 2. Flexible Meta Tag Search
+        meta_patterns = [
+            r'<meta[^>]+(?:property|name)=["\'](?:og:image|twitter:image)["\'][^>]+content=["\']([^"\']+)["\']',
+            r'<meta[^>]+content=["\']([^"\']+)["\'][^>]+(?:property|name)=["\'](?:og:image|twitter:image)["\']'
+        ]
+
+        for pattern in meta_patterns:
+            matches = re.findall(pattern, res_html, re.IGNORECASE)
+            for img_url in matches:
+                clean_url = html.unescape(img_url)
+                # Filter out placeholders & generics
+                poisoned = ["2a96cbd8b46e442fc41c2b86b821562f", "avatar", "default_artist", "lastfm_logo", "placeholder"]
+                if not any(p in clean_url for p in poisoned):
+                    return clean_url
+
+    except Exception as e:
+        print(f"SCRAPE ERROR for {artist_name}: {e}")
+    return ""
+
+def _scrape_lastfm_track_image(track_name, artist_name):
+    """Fallback scraper to get track image from last.fm website without API limits."""
+    from app.cache_handler import get_image_cache, set_image_cache
+    cache_key = f"{artist_name}__{track_name}"
+    cached_img = get_image_cache(cache_key)
+    if cached_img:
+        return "" if cached_img == "__NOT_FOUND__" else cached_img
+
+    import re
+    try:
+        url = f"https://www.last.fm/music/{quote_plus(artist_name)}/_/{quote_plus(track_name)}"
+        headers = {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+            "Accept-Language": "en-US,en;q=0.5"
+        }
+        res = http_handler.get(url, headers=headers, timeout=5)
+        if res.status_code == 200:
+            matches = re.findall(r'<meta\s+(?:property|name)=[\'"](?:og:image|twitter:image)[\'"]\s+content=[\'"]([^\'"]+)[\'"]', res.text)
+            if not matches:
+                 matches = re.findall(r'<meta\s+content=[\'"]([^\'"]+)[\'"]\s+(?:property|name)=[\'"](?:og:image|twitter:image)[\'"]', res.text)
+
+            for img_url in matches:
+                if "2a96cbd8b46e442fc41c2b86b821562f" not in img_url and "avatar" not in img_url and "default" not in img_url:
+                    set_image_cache(cache_key, img_url)
+                    return img_url
+    except Exception:
+        pass
+    return ""
+
+# --- IMAGE RESOLUTION ---
+
+# Per-provider rate limits (requests/sec, burst), shared by every resolution in this process
+IMAGE_PROVIDER_LIMITS = {
+    "lastfm_api": (5, 5),
+    "spotify": (10, 10),
+    "lastfm_scrape": (2, 4),
+    "deezer": (10, 10),
+    "itunes": (0.3, 5), # iTunes Search allows ~20 requests/minute
+}
+
+def _provider(name, fn):
+    rate, burst = IMAGE_PROVIDER_LIMITS[name]
+    return (name, fn, rate, burst)
+
+def _valid_or_empty(url):
+    return url if _is_valid_image(url) else ""
+
+def _artist_image_providers(token):
+    """Priority order: Last.fm API -> Spotify -> Last.fm page scrape -> Deezer."""
+    providers = [_provider("lastfm_api", lambda name, tok: _valid_or_empty(_get_artist_image(name)))]
+    if token:
+        providers.append(_provider("spotify", lambda name, tok: _search_spotify_artist_image(name, tok)))
+    providers.append(_provider("lastfm_scrape", lambda name, tok: _valid_or_empty(_scrape_lastfm_artist_image(name))))
+    providers.append(_provider("deezer", lambda name, tok: _search_deezer_artist(name)))
+    return providers
+
+def _track_image_providers(token):
+    """Priority order: Last.fm API -> Spotify -> iTunes -> Last.fm page scrape. Each returns {"id", "image"}."""
+    providers = [_provider("lastfm_api", lambda t, a, tok: {"id": None, "image": _valid_or_empty(_get_track_image(a, t))})]
+    if token:
+        def _spotify(t, a, tok):
+            sp_id, img = _search_spotify_track(t, a, tok)
+            return {"id": sp_id, "image": img}
+        providers.append(_provider("spotify", _spotify))
+    providers.append(_provider("itunes", lambda t, a, tok: {"id": None, "image": _valid_or_empty(_search_itunes_track(t, a))}))
+    providers.append(_provider("lastfm_scrape", lambda t, a, tok: {"id": None, "image": _valid_or_empty(_scrape_lastfm_track_image(t, a))}))
+    return providers
+
+# Durable rows (media_metadata) older than this are re-checked by refresh_stale_media_metadata;
+# until then they are served as-is. Negative rows are retried sooner.
+MEDIA_METADATA_MAX_AGE = int(os.getenv("MEDIA_METADATA_MAX_AGE", 2592000)) # 30 days
+MEDIA_METADATA_NEGATIVE_MAX_AGE = 86400 # 1 day
+# A stale row the refresher couldn't re-resolve (e.g. no Spotify token) is retried after this
+MEDIA_METADATA_RECHECK_INTERVAL = int(os.getenv("MEDIA_METADATA_RECHECK_INTERVAL", 86400)) # 1 day
+
+# Negative track artwork entries expire sooner so new releases get picked up
+TRACK_IMAGE_NEGATIVE_TTL = 86400 # 1 day
+
+async def _resolve_artist_image(name, token, force_refresh=False, durable=None, persist=None):
+    """
+    Artist image: Redis img:* (still valid) -> durable media_metadata row -> providers.
+    Network results are cached in img:* and appended to persist as media_metadata rows.
+    """
+    if not force_refresh:
+        entry = get_image_cache_entry(name)
+        if entry and entry.get("url"):
+            cached = entry["url"]
+            # Recently validated (or trusted CDN): no HEAD probe
+            if not is_bad_image(cached) and (
+                _is_trusted_image_host(cached) or time.time() - (entry.get("validated_at") or 0) < IMAGE_REVALIDATE_INTERVAL
+            ):
+                return cached
+            ok, size = await asyncio.to_thread(_check_image, cached)
+            if ok:
+                set_image_cache(name, cached, validated_at=time.time(), size=size)
+                return cached
+            delete_image_cache(name)
+
+        if durable:
+            if durable["image_url"] and not is_bad_image(durable["image_url"]):
+                set_image_cache(name, durable["image_url"], validated_at=time.time() - durable["age"])
+                return durable["image_url"]
+            if not durable["image_url"] and durable["age"] < MEDIA_METADATA_NEGATIVE_MAX_AGE:
+                return ""
+
+    provider, img, _ = await resolve_first(_artist_image_providers(token), (name, token))
+    if img:
+        # Every provider answer is validated (or comes from a trusted CDN)
+        set_image_cache(name, img, validated_at=time.time())
+    if persist is not None:
+        persist.append(("artist", _artist_key(name), name, None, None, img or None, provider or "none"))
+    return img or ""
+
+async def _resolve_track_image(t_name, a_name, token, force_refresh=False, durable=None, persist=None):
+    """
+    Track artwork: Redis img:track:* -> durable media_metadata row -> providers.
+    Network results (including misses) are cached and appended to persist as media_metadata rows.
+    """
+    track_key = canonical_track_key(t_name, a_name)
+    if not force_refresh:
+        cached = get_track_image_cache(track_key)
+        if cached is not None:
+            return {"id": cached.get("id"), "image": cached.get("image", "")}
+
+        if durable:
+            if durable["image_url"]:
+                set_track_image_cache(track_key, durable["spotify_id"], durable["image_url"])
+                return {"id": durable["spotify_id"], "image": durable["image_url"]}
+            if durable["age"] < MEDIA_METADATA_NEGATIVE_MAX_AGE:
+                set_track_image_cache(track_key, durable["spotify_id"], "", ttl=TRACK_IMAGE_NEGATIVE_TTL)
+                return {"id": durable["spotify_id"], "image": ""}
+
+    provider, value, results = await resolve_first(
+        _track_image_providers(token), (t_name, a_name, token),
+        accept=lambda v: bool(v and v.get("image"))
+    )
+    # Keep the Spotify track id whenever Spotify answered, even if another provider won the image
+    sp_id = (results.get("spotify") or {}).get("id")
+    image = value["image"] if value else ""
+    if image:
+        set_track_image_cache(track_key, sp_id, image)
+    elif token:
+        # Only record a miss when every provider (Spotify included) was actually asked
+        set_track_image_cache(track_key, sp_id, "", ttl=TRACK_IMAGE_NEGATIVE_TTL)
+    if persist is not None and (image or token):
+        persist.append(("track", track_key, t_name, a_name, sp_id, image or None, provider or "none"))
+    return {"id": sp_id, "image": image}
+
+def _track_artist_name(t):
+    return t.get("artist", {}).get("name") if isinstance(t.get("artist"), dict) else t.get("artist")
+
+async def _resolve_all_images(raw_artists, raw_tracks, token, force_refresh=False):
+    """
+    Resolve every artist and track image concurrently. Returns (artist_results_map, track_results_map).
+    The durable media_metadata index is read in one batch per kind before any network call,
+    and everything resolved over the network is written back in one batch.
+    """
+    from app.db_handler import get_media_metadata_batch, save_media_metadata_batch
+
+    artist_keys = [_artist_key(a.get("name")) for a in raw_artists]
+    track_keys = [canonical_track_key(t.get("name"), _track_artist_name(t)) for t in raw_tracks]
+    durable_artists, durable_tracks = {}, {}
+    if not force_refresh:
+        try:
+            durable_artists = get_media_metadata_batch("artist", artist_keys)
+            durable_tracks = get_media_metadata_batch("track", track_keys)
+        except Exception as e:
+            print(f"MEDIA METADATA READ ERROR: {e}")
+
+    persist = []
+    artist_jobs = [
+        _resolve_artist_image(a.get("name"), token, force_refresh, durable_artists.get(k), persist)
+        for a, k in zip(raw_artists, artist_keys)
+    ]
+    track_jobs = [
+        _resolve_track_image(t.get("name"), _track_artist_name(t), token, force_refresh, durable_tracks.get(k), persist)
+        for t, k in zip(raw_tracks, track_keys)
+    ]
+    results = await asyncio.gather(*artist_jobs, *track_jobs, return_exceptions=True)
+
+    if persist:
+        try:
+            save_media_metadata_batch(persist)
+        except Exception as e:
+            print(f"MEDIA METADATA WRITE ERROR: {e}")
+
+    artist_results_map, track_results_map = {}, {}
+    for i, res in enumerate(results[:len(artist_jobs)]):
+        if isinstance(res, Exception):
+            print(f"LASTFM BG ARTIST IMAGE ERROR at index {i}: {res}")
+        elif res:
+            artist_results_map[i] = res
+    for i, res in enumerate(results[len(artist_jobs):]):
+        if isinstance(res, Exception):
+            print(f"LASTFM BG TRACK IMAGE ERROR at index {i}: {res}")
+        else:
+            track_results_map[i] = res
+    return artist_results_map, track_results_map
+
+def refresh_stale_media_metadata(limit=50):
+    """
+    Re-resolve the oldest media_metadata rows (older than MEDIA_METADATA_MAX_AGE) and
+    refresh both the durable row and its Redis entry. Returns {"checked", "found"}.
+    Every row looked at gets last_checked stamped, so rows that can't be re-resolved right now
+    (e.g. tracks while no Spotify token is available) wait MEDIA_METADATA_RECHECK_INTERVAL
+    instead of being picked first on every run.
+    Runs from /admin/refresh-media or the /api/tasks/refresh-media QStash schedule.
+    """
+    from app.db_handler import get_stale_media_metadata, mark_media_metadata_checked
+
+    rows = get_stale_media_metadata(MEDIA_METADATA_MAX_AGE, MEDIA_METADATA_RECHECK_INTERVAL, limit)
+    if not rows:
+        return {"checked": 0, "found": 0}
+    artists = [{"name": name} for kind, _, name, _ in rows if kind == "artist"]
+    tracks = [{"name": name, "artist": artist} for kind, _, name, artist in rows if kind == "track"]
+
+    try:
+        artist_map, track_map = run_async(
+            _resolve_all_images(artists, tracks, get_spotify_app_token(), force_refresh=True)
+        )
+    finally:
+        mark_media_metadata_checked([(kind, key) for kind, key, _, _ in rows])
+    found = len(artist_map) + sum(1 for v in track_map.values() if v.get("image"))
+    print(f"MEDIA METADATA REFRESH: {len(rows)} checked, {found} with imagery.")
+    return {"checked": len(rows), "found": found}
 
-        def _get_best_artist_image(idx, name, token, force_refresh=False):
-            """Resolve artist image: Spotify → Last.fm → Deezer. Successful result cached in img."""
-            if not force_refresh:
-                cached = get_image_cache(name)
-                if cached:
-                    if not _is_valid_image(cached):
-                        delete_image_cache(name)
-                    else:
-                        return idx, cached
-
-            lfm_api_img = _get_artist_image(name)
-            if _is_valid_image(lfm_api_img):
-                set_image_cache(name, lfm_api_img)
-                return idx, lfm_api_img
-
-            if token:
-                img = _search_spotify_artist_image(name, token)
-                if img:
-                    set_image_cache(name, img)
-                    return idx, img
-
-            img = _scrape_lastfm_artist_image(name)
-            if _is_valid_image(img):
-                set_image_cache(name, img)
-                return idx, img
-
-            img = _search_deezer_artist(name)
-            if img:
-                set_image_cache(name, img)
-                return idx, img
-            return idx, ""
+# --- BACKGROUND PROCESSING ---
 
+def _enhancement_inputs(result):
+    """
+    (artists, tracks) in the raw Last.fm shape _resolve_all_images expects, rebuilt from the
+    fast-sync result. Only names are needed, so the raw API responses are never stored or shipped.
+    """
+    raw_artists = [{"name": a.get("name")} for a in result.get("artists", [])]
+    raw_tracks = [
+        {"name": t.get("name"), "artist": (t.get("artists") or [""])[0]}
+        for t in result.get("tracks", [])
+    ]
+    return raw_artists, raw_tracks
+
+def process_lastfm_enhancement_background(username, time_range, result, extended=False, force_sync=False, sync_id=None, enhance_id=None):
+    """
+    Background task to enhance Last.fm data with Spotify metadata,
+    artist tags (genres), and sentiment analysis.
+    enhance_id names the lastfm:enhance:* input stored by sync_lastfm_user_data; it is
+    deleted only once the pass succeeds, so QStash retries still find it.
+    """
+    completed = False
+    try:
         user_id = f"lastfm:{username}"
         
         # 0. Acquire Lock to prevent multiple background workers
@@ -212,64 +433,23 @@ def process_lastfm_enhancement_background(username, time_range, result, extended
 
         print(f"LASTFM BG: Starting enhancement for '{username}'...")
         
-        raw_artists = result.get("_raw_artists", [])
-        raw_tracks = result.get("_raw_tracks", [])
-        sp_token = _get_spotify_app_token()
+        if result is None:
+            # QStash messages carry only a reference to the stored fast-sync result
+            if enhance_id:
+                result = get_lastfm_enhance_input(enhance_id)
+            else:
+                result = get_cached_top_data("top", user_id, time_range)
+            if not result:
+                print(f"LASTFM BG: No fast-sync result stored for {user_id}:{time_range}. Exiting.")
+                return
 
-        # 1. Fetch Artist Images
-        artist_results_map = {}
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            artist_futures = {
-                executor.submit(_get_best_artist_image, i, a.get("name"), sp_token, force_refresh=force_sync): i 
-                for i, a in enumerate(raw_artists)
-            }
-            from concurrent.futures import as_completed
-            for future in as_completed(artist_futures):
-                try:
-                    res_idx, img_url = future.result()
-                    if img_url:
-                        artist_results_map[res_idx] = img_url
-                except Exception as e:
-                    print(f"LASTFM BG ARTIST IMAGE ERROR at index {artist_futures.get(future)}: {e}")
-
-        # 1b. Fetch Track Images
-        track_results_map = {}
-        def _get_best_track_image(idx, t_name, a_name):
-            sp_id, final_img = None, ""
-            lfm_api_img = _get_track_image(a_name, t_name)
-            if _is_valid_image(lfm_api_img):
-                return idx, sp_id, lfm_api_img
-            if sp_token:
-                try:
-                    sp_id, final_img = _search_spotify_track(t_name, a_name, sp_token)
-                except Exception: pass
-            if not final_img:
-                try:
-                    it_img = _search_itunes_track(t_name, a_name)
-                    if _is_valid_image(it_img):
-                        return idx, sp_id, it_img
-                except Exception: pass
-            if not final_img:
-                try:
-                    lfm_img = _scrape_lastfm_track_image(t_name, a_name)
-                    if _is_valid_image(lfm_img):
-                        return idx, sp_id, lfm_img
-                except Exception: pass
-            return idx, sp_id, final_img
+        raw_artists, raw_tracks = _enhancement_inputs(result)
+        sp_token = get_spotify_app_token()
 
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            track_futures = {
-                executor.submit(_get_best_track_image, i, t.get("name"), 
-                                t.get("artist", {}).get("name") if isinstance(t.get("artist"), dict) else t.get("artist")
-                               ): i 
-                for i, t in enumerate(raw_tracks)
-            }
-            for future in as_completed(track_futures):
-                try:
-                    res_idx, sp_id, sp_img = future.result()
-                    track_results_map[res_idx] = {"id": sp_id, "image": sp_img}
-                except Exception as e:
-                    print(f"LASTFM BG TRACK IMAGE ERROR at index {track_futures.get(future)}: {e}")
+        # 1. Resolve Artist & Track Images (async, all items at once)
+        artist_results_map, track_results_map = run_async(
+            _resolve_all_images(raw_artists, raw_tracks, sp_token, force_refresh=force_sync)
+        )
 
         # 2. Update Artists & Tracks
         enhanced_artists = result.get("artists", [])
@@ -293,32 +473,23 @@ def process_lastfm_enhancement_background(username, time_range, result, extended
 
         cache_top_data("top", user_id, time_range, result, ttl=60)
 
-        # 3. Fetch Artist Tags
+        # 3. Artist Tags (global cache; only unknown/stale artists hit Last.fm)
         genre_count = {}
-        def _fetch_artist_genres(artist_name):
-            try:
-                tag_data = _lastfm_request("artist.getTopTags", {"artist": artist_name})
-                if tag_data and "toptags" in tag_data:
-                    tags = tag_data["toptags"].get("tag", [])
-                    return [t.get("name", "").lower() for t in tags[:5]]
-            except: pass
-            return []
-
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            artist_names = [a.get("name") for a in raw_artists[:15]]
-            future_genres = {executor.submit(_fetch_artist_genres, name): name for name in artist_names}
-            for future in as_completed(future_genres):
-                artist_name = future_genres[future]
-                try:
-                    genres = future.result()
-                    for g in genres:
-                        if g not in ["seen live", "favorites", "favourite", "awesome", "scrobble", "alternative", "all", "amazing"]:
-                            genre_count[g] = genre_count.get(g, 0) + 1
-                    for ra in enhanced_artists:
-                        if ra["name"] == artist_name:
-                            ra["genres"] = genres
-                            break
-                except: continue
+        artist_names = [a.get("name") for a in raw_artists[:15]]
+        try:
+            artist_tags = get_artist_tags_batch(artist_names)
+        except Exception as e:
+            print(f"LASTFM BG ARTIST TAGS ERROR: {e}")
+            artist_tags = {}
+
+        for artist_name, genres in artist_tags.items():
+            for g in genres:
+                if g not in ["seen live", "favorites", "favourite", "awesome", "scrobble", "alternative", "all", "amazing"]:
+                    genre_count[g] = genre_count.get(g, 0) + 1
+            for ra in enhanced_artists:
+                if ra["name"] == artist_name:
+                    ra["genres"] = genres
+                    break
 
         sorted_genres = sorted(genre_count.items(), key=lambda x: x[1], reverse=True)
         result["genres"] = [{"name": name, "count": count} for name, count in sorted_genres[:20]]
@@ -365,13 +536,10 @@ def process_lastfm_enhancement_background(username, time_range, result, extended
                 final_cache["sentiment_report"] = sentiment_report
                 final_cache["sentiment_scores"] = sentiment_scores
                 final_cache["sentiment_count"] = 10
-            
-            # Cleanup raw data to save space
-            if "_raw_artists" in final_cache: del final_cache["_raw_artists"]
-            if "_raw_tracks" in final_cache: del final_cache["_raw_tracks"]
-            
+
             cache_top_data("top", user_id, time_range, final_cache, ttl=3600)
             save_user_sync(user_id, time_range, final_cache)
+        completed = True
         print(f"LASTFM BG: All enhancements complete for {user_id}")
         
     except Exception as e:
@@ -388,6 +556,8 @@ def process_lastfm_enhancement_background(username, time_range, result, extended
         release_analysis_lock(user_id, time_range)
         if 'result' in locals() and result:
             cache_top_data("top", user_id, time_range, result, ttl=300)
+        if completed and enhance_id:
+            delete_lastfm_enhance_input(enhance_id)
 
 
 def process_lastfm_sentiment_background(user_id, time_range, extended=False, sync_id=None):
@@ -476,36 +646,6 @@ def process_lastfm_sentiment_background(user_id, time_range, extended=False, syn
 
 # --- SPOTIFY ENHANCEMENT HELPERS ---
 
-def _get_spotify_app_token():
-    """Get Client Credentials token from Spotify."""
-    client_id = os.getenv("SPOTIFY_CLIENT_ID")
-    client_secret = os.getenv("SPOTIFY_CLIENT_SECRET")
-    if not client_id or not client_secret:
-        print("SPOTIFY APP TOKEN ERROR: Missing credentials in .env")
-        return None
-
-    auth_str = f"{client_id}:{client_secret}"
-    b64_auth_str = base64.b64encode(auth_str.encode()).decode()
-
-    headers = {
-        "Authorization": f"Basic {b64_auth_str}",
-        "Content-Type": "application/x-www-form-urlencoded"
-    }
-    data = {"grant_type": "client_credentials"}
-
-    try:
-        res = requests.post("https://accounts.spotify.com/api/token", headers=headers, data=data, timeout=5)
-        if res.status_code == 200:
-            token = res.json().get("access_token")
-            if token:
-                print(f"SPOTIFY APP TOKEN: Successfully retrieved (starts with {token[:6]}...)")
-            return token
-        else:
-            print(f"SPOTIFY APP TOKEN ERROR: {res.status_code} - {res.text}")
-    except Exception as e:
-        print(f"SPOTIFY APP TOKEN ERROR: {e}")
-    return None
-
 def _search_spotify_artist(artist_name, token):
     """Search for an artist on Spotify and return (id, image_url)."""
     if not token or not artist_name:
@@ -531,7 +671,7 @@ def _search_spotify_artist(artist_name, token):
     # Try exact match first
     params = {"q": f"artist:\"{artist_name}\"", "type": "artist", "limit": 5}
     try:
-        res = requests.get("https://api.spotify.com/v1/search", headers=headers, params=params, timeout=5)
+        res = http_handler.get("https://api.spotify.com/v1/search", headers=headers, params=params, timeout=5)
         if res.status_code == 200:
             sp_artist = find_best_match(res.json().get("artists", {}).get("items", []))
     except Exception:
@@ -541,7 +681,7 @@ def _search_spotify_artist(artist_name, token):
     if not sp_artist:
         params = {"q": artist_name, "type": "artist", "limit": 5}
         try:
-            res = requests.get("https://api.spotify.com/v1/search", headers=headers, params=params, timeout=5)
+            res = http_handler.get("https://api.spotify.com/v1/search", headers=headers, params=params, timeout=5)
             if res.status_code == 200:
                 sp_artist = find_best_match(res.json().get("artists", {}).get("items", []))
         except Exception:
@@ -571,7 +711,7 @@ def _search_spotify_track(track_name, artist_name, token):
     query = f"track:\"{clean_track}\" artist:\"{artist_name}\""
     params = {"q": query, "type": "track", "limit": 2} # Get top 2 to check best match
     try:
-        res = requests.get("https://api.spotify.com/v1/search", headers=headers, params=params, timeout=5)
+        res = http_handler.get("https://api.spotify.com/v1/search", headers=headers, params=params, timeout=5)
         if res.status_code == 200:
             items = res.json().get("tracks", {}).get("items", [])
             for item in items:
@@ -594,7 +734,7 @@ def _search_spotify_track(track_name, artist_name, token):
     query = f"{clean_track} {artist_name}"
     params = {"q": query, "type": "track", "limit": 2}
     try:
-        res = requests.get("https://api.spotify.com/v1/search", headers=headers, params=params, timeout=5)
+        res = http_handler.get("https://api.spotify.com/v1/search", headers=headers, params=params, timeout=5)
         if res.status_code == 200:
             items = res.json().get("tracks", {}).get("items", [])
             for item in items:
@@ -622,7 +762,7 @@ def _search_itunes_track(track_name, artist_name):
         clean_track = track_name.split(" - ")[0].split(" (")[0]
         query = f"{clean_track} {artist_name}"
         url = f"https://itunes.apple.com/search?term={quote_plus(query)}&entity=song&limit=1"
-        res = requests.get(url, timeout=5)
+        res = http_handler.get(url, timeout=5)
         if res.status_code == 200:
             data = res.json()
             if data['resultCount'] > 0:
@@ -648,7 +788,7 @@ def _search_deezer_artist(artist_name):
         return ""
     try:
         url = f"https://api.deezer.com/search/artist?q={quote_plus(artist_name)}"
-        res = requests.get(url, timeout=5)
+        res = http_handler.get(url, timeout=5)
         if res.status_code == 200:
             data = res.json()
             items = data.get("data", [])
@@ -675,7 +815,7 @@ def _lastfm_request(method, params=None):
         "format": "json"
     })
     try:
-        res = requests.get(LASTFM_API_URL, params=params, timeout=10)
+        res = http_handler.get(LASTFM_API_URL, params=params, timeout=10)
         res.raise_for_status()
         return res.json()
     except requests.exceptions.RequestException as e:
@@ -703,7 +843,7 @@ def _lastfm_signed_request(method, params=None):
     params["format"] = "json"
 
     try:
-        res = requests.get(LASTFM_API_URL, params=params, timeout=10)
+        res = http_handler.get(LASTFM_API_URL, params=params, timeout=10)
         res.raise_for_status()
         return res.json()
     except requests.exceptions.RequestException as e:
@@ -717,13 +857,19 @@ def get_session_key(token):
 
 
 def get_user_info(username):
-    """Get Last.fm user profile info."""
+    """Get Last.fm user profile info (refreshes the short-lived profile cache)."""
     data = _lastfm_request("user.getInfo", {"user": username})
     if not data or "user" not in data:
         return None
+    set_lastfm_user_info_cache(username, data["user"])
     return data["user"]
 
 
+def get_cached_user_info(username):
+    """Profile info from the short-lived cache, falling back to a live Last.fm call."""
+    return get_lastfm_user_info_cache(username) or get_user_info(username)
+
+
 def get_top_artists(username, time_range="medium_term", limit=20):
     """Get user's top artists from Last.fm."""
     period = PERIOD_MAP.get(time_range, "6month")
@@ -756,21 +902,180 @@ def get_top_tags(username, time_range="medium_term", limit=20):
     # So we fetch top artists and aggregate their tags
     artists = get_top_artists(username, time_range, limit)
     genre_count = {}
-    for artist in artists:
-        artist_name = artist.get("name", "")
-        # Fetch artist tags
-        tag_data = _lastfm_request("artist.getTopTags", {"artist": artist_name})
-        if tag_data and "toptags" in tag_data:
-            tags = tag_data["toptags"].get("tag", [])
-            for tag in tags[:5]:  # Top 5 tags per artist
-                tag_name = tag.get("name", "").lower()
-                if tag_name:
-                    genre_count[tag_name] = genre_count.get(tag_name, 0) + 1
+    artist_tags = get_artist_tags_batch([a.get("name", "") for a in artists])
+    for tags in artist_tags.values():
+        for tag_name in tags:  # Top 5 tags per artist
+            genre_count[tag_name] = genre_count.get(tag_name, 0) + 1
 
     sorted_genres = sorted(genre_count.items(), key=lambda x: x[1], reverse=True)
     return [{"name": name, "count": count} for name, count in sorted_genres[:20]]
 
 
+# --- SCROBBLE HISTORY (user.getRecentTracks) ---
+
+# Pages fetched per ingestion run; a long history is backfilled over several syncs.
+LASTFM_SCROBBLE_MAX_PAGES = int(os.getenv("LASTFM_SCROBBLE_MAX_PAGES", 25))
+LASTFM_SCROBBLE_PAGE_SIZE = 200 # Last.fm maximum
+
+def _get_recent_tracks_page(username, page, from_uts, to_uts):
+    """One page of user.getRecentTracks in [from_uts, to_uts]. Returns (scrobble rows, total_pages) or None."""
+    params = {"user": username, "page": page, "limit": LASTFM_SCROBBLE_PAGE_SIZE, "to": to_uts}
+    if from_uts:
+        params["from"] = from_uts
+    data = _lastfm_request("user.getRecentTracks", params)
+    if not data or "recenttracks" not in data:
+        return None
+    recent = data["recenttracks"]
+    total_pages = int(recent.get("@attr", {}).get("totalPages", 0) or 0)
+    tracks = recent.get("track", [])
+    if isinstance(tracks, dict):
+        tracks = [tracks] # Single result comes back as an object
+
+    rows = []
+    for t in tracks:
+        date = t.get("date")
+        if not date or t.get("@attr", {}).get("nowplaying"):
+            continue # Now-playing entry has no timestamp and isn't a scrobble yet
+        artist = t.get("artist", {})
+        album = t.get("album", {})
+        rows.append((
+            int(date.get("uts")),
+            (artist.get("#text") or artist.get("name") or "") if isinstance(artist, dict) else str(artist),
+            t.get("name", ""),
+            (album.get("#text") if isinstance(album, dict) else album) or None,
+        ))
+    return rows, total_pages
+
+def ingest_lastfm_scrobbles(username, max_pages=None):
+    """
+    Incrementally copy a user's scrobbles into Postgres.
+    The window is fixed to [cursor, now] at the start of the run, so page numbers stay stable;
+    pages are walked oldest-first (last page -> page 1) and the cursor advances after each saved page.
+    An interrupted or page-capped run therefore resumes exactly where it stopped on the next sync.
+    Returns {"ingested", "pages", "complete"}.
+    """
+    from app.db_handler import save_scrobbles_batch, get_scrobble_cursor, set_scrobble_cursor
+
+    user_id = f"lastfm:{username}"
+    max_pages = max_pages or LASTFM_SCROBBLE_MAX_PAGES
+    if not acquire_analysis_lock(user_id, "scrobbles", ttl=900):
+        print(f"LASTFM SCROBBLES: Ingestion already running for {user_id}. Skipping.")
+        return {"ingested": 0, "pages": 0, "complete": False}
+
+    ingested, pages_done, complete = 0, 0, False
+    try:
+        cursor = get_scrobble_cursor(user_id)
+        to_uts = int(time.time())
+        # Cursor is inclusive: scrobbles sharing its second are re-sent and ignored on insert
+        first = _get_recent_tracks_page(username, 1, cursor, to_uts)
+        if first is None:
+            print(f"LASTFM SCROBBLES: Could not fetch recent tracks for {username}.")
+            return {"ingested": 0, "pages": 0, "complete": False}
+        first_rows, total_pages = first
+
+        for page in range(max(total_pages, 1), 0, -1):
+            if pages_done >= max_pages:
+                break
+            if page == 1:
+                rows = first_rows
+            else:
+                fetched = _get_recent_tracks_page(username, page, cursor, to_uts)
+                if fetched is None:
+                    print(f"LASTFM SCROBBLES: Page {page} failed for {username}. Resuming next sync.")
+                    break
+                rows = fetched[0]
+
+            save_scrobbles_batch(user_id, rows)
+            if rows:
+                set_scrobble_cursor(user_id, max(r[0] for r in rows))
+            ingested += len(rows)
+            pages_done += 1
+        else:
+            complete = True
+
+        print(f"LASTFM SCROBBLES: {username}: {ingested} scrobbles from {pages_done}/{total_pages} pages (complete: {complete}).")
+    except Exception as e:
+        print(f"LASTFM SCROBBLES ERROR: {e}")
+    finally:
+        release_analysis_lock(user_id, "scrobbles")
+    return {"ingested": ingested, "pages": pages_done, "complete": complete}
+
+def get_scrobble_top_items(username, kind, start_uts, end_uts, limit=20):
+    """Top artists/tracks for an arbitrary date range, computed from stored scrobbles (no API calls)."""
+    from app.db_handler import get_scrobble_top, get_scrobble_count
+
+    user_id = f"lastfm:{username}"
+    return {
+        "items": get_scrobble_top(user_id, kind, start_uts, end_uts, limit),
+        "total_scrobbles": get_scrobble_count(user_id, start_uts, end_uts),
+    }
+
+
+# --- ARTIST TAG METADATA ---
+
+# Tags are refreshed at most this often; older entries are still served if a refresh fails.
+ARTIST_TAGS_MAX_AGE = int(os.getenv("ARTIST_TAGS_MAX_AGE", 1209600)) # 14 days
+
+def _artist_key(artist_name):
+    return " ".join((artist_name or "").lower().split())
+
+def _fetch_artist_tags(artist_name):
+    """Normalised top-5 tags for an artist from Last.fm, or None if the request failed."""
+    tag_data = _lastfm_request("artist.getTopTags", {"artist": artist_name})
+    if not tag_data or "toptags" not in tag_data:
+        return None
+    tags = []
+    for t in tag_data["toptags"].get("tag", []):
+        name = " ".join(t.get("name", "").lower().split())
+        if name and name not in tags:
+            tags.append(name)
+        if len(tags) >= 5: break
+    return tags
+
+def get_artist_tags_batch(artist_names):
+    """
+    Tags for many artists at once: Redis (MGET) -> Postgres artist_tags -> Last.fm.
+    Only unknown or stale artists hit Last.fm; results are shared across all users.
+    Returns {artist_name: [tags]}.
+    """
+    from app.cache_handler import get_artist_tags_cache_many, set_artist_tags_cache_many
+    from app.db_handler import get_artist_tags_batch as db_get_artist_tags, save_artist_tags_batch
+
+    names = {}
+    for name in artist_names:
+        if name: names.setdefault(_artist_key(name), name)
+    keys = list(names)
+
+    entries = get_artist_tags_cache_many(keys)
+    missing = [k for k in keys if k not in entries]
+    if missing:
+        try:
+            from_db = db_get_artist_tags(missing)
+            entries.update(from_db)
+            set_artist_tags_cache_many(from_db)
+        except Exception as e:
+            print(f"ARTIST TAGS DB READ ERROR: {e}")
+
+    now = time.time()
+    to_fetch = [k for k in keys if k not in entries or now - entries[k]["refreshed_at"] > ARTIST_TAGS_MAX_AGE]
+    print(f"ARTIST TAGS: {len(keys) - len(to_fetch)}/{len(keys)} served from cache, fetching {len(to_fetch)}.")
+
+    if to_fetch:
+        fresh = {}
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            for key, tags in zip(to_fetch, executor.map(lambda k: _fetch_artist_tags(names[k]), to_fetch)):
+                if tags is not None:
+                    fresh[key] = {"tags": tags, "refreshed_at": now}
+        if fresh:
+            entries.update(fresh)
+            set_artist_tags_cache_many(fresh)
+            try:
+                save_artist_tags_batch([(k, names[k], v["tags"]) for k, v in fresh.items()])
+            except Exception as e:
+                print(f"ARTIST TAGS DB WRITE ERROR: {e}")
+
+    return {names[k]: entries[k]["tags"] for k in keys if k in entries}
+
 def _get_artist_image(artist_name):
     """Try to get artist image from Last.fm artist.getInfo."""
     data = _lastfm_request("artist.getInfo", {"artist": artist_name})
@@ -805,11 +1110,32 @@ def sync_lastfm_user_data(username: str, time_range: str = "medium_term", backgr
     """
     print(f"LASTFM SYNC: Starting sync for user '{username}', time_range='{time_range}'")
 
-    # 1. Fetch User Info
-    user_info = get_user_info(username)
+    # 1. Fetch User Info + Top Data (Artists/Tracks) concurrently: independent calls, one round trip
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = {
+            "user_info": executor.submit(get_user_info, username),
+            "artists": executor.submit(get_top_artists, username, time_range, 20),
+            "tracks": executor.submit(get_top_tracks, username, time_range, 20),
+        }
+    fetched = {}
+    for name, future in futures.items():
+        try:
+            fetched[name] = future.result()
+        except Exception as e:
+            print(f"LASTFM SYNC ERROR: {name} fetch failed for '{username}': {e}")
+            fetched[name] = None
+
+    user_info = fetched["user_info"]
+    raw_artists = fetched["artists"] or []
+    raw_tracks = fetched["tracks"] or []
+
     if not user_info:
-        print(f"LASTFM SYNC ERROR: Could not fetch user info for '{username}'")
-        return None
+        # No profile and no top data: unknown user or Last.fm is down
+        if not raw_artists and not raw_tracks:
+            print(f"LASTFM SYNC ERROR: Could not fetch user info for '{username}'")
+            return None
+        print(f"LASTFM SYNC WARNING: User info unavailable for '{username}', continuing with top data.")
+        user_info = {"name": username}
 
     display_name = user_info.get("realname") or user_info.get("name", username)
     user_image = ""
@@ -823,11 +1149,7 @@ def sync_lastfm_user_data(username: str, time_range: str = "medium_term", backgr
     user_id = f"lastfm:{username}"
     save_user(user_id, display_name)
 
-    # 2. Fetch Top Data (Artists/Tracks)
-    raw_artists = get_top_artists(username, time_range, 20)
-    raw_tracks = get_top_tracks(username, time_range, 20)
-
-    # 3. Fast Map to Personalify format (No Spotify search here, just raw LFM)
+    # 2. Fast Map to Personalify format (No Spotify search here, just raw LFM)
     artists_to_save = []
     artist_ids = []
     result_artists = []
@@ -891,7 +1213,7 @@ def sync_lastfm_user_data(username: str, time_range: str = "medium_term", backgr
     save_user_associations_batch("user_artists", "artist_id", user_id, artist_ids)
     save_user_associations_batch("user_tracks", "track_id", user_id, track_ids)
 
-    # 4. Build Initial Result (Syncing state)
+    # 3. Build Initial Result (Syncing state)
     result = {
         "user": display_name,
         "image": user_image,
@@ -901,31 +1223,37 @@ def sync_lastfm_user_data(username: str, time_range: str = "medium_term", backgr
         "time_range": time_range,
         "source": "lastfm",
         "sentiment_report": "Syncing your music vibe",
-        "sentiment_scores": [],
-        "_raw_artists": raw_artists,
-        "_raw_tracks": raw_tracks
+        "sentiment_scores": []
     }
 
-    # 5. Handle Background Tasks (QStash for Vercel, BackgroundTasks for Local)
+    # 4. Handle Background Tasks (QStash for Vercel, BackgroundTasks for Local)
     # Save temporary results first
     cache_top_data("top", f"lastfm:{username}", time_range, result, ttl=300)
+    # The enhancement input gets its own key: the top entry above is short-lived and
+    # rewritten by the worker, so a delayed or retried delivery could not rely on it
+    enhance_id = uuid.uuid4().hex
+    set_lastfm_enhance_input(enhance_id, result)
     
     from app.qstash_handler import publish_to_qstash
     did_push = publish_to_qstash("/api/tasks/lastfm-enhancement", {
         "username": username,
         "time_range": time_range,
         "extended": extended,
-        "result": result,
-        "force_sync": force_sync
+        "force_sync": force_sync,
+        "enhance_id": enhance_id
     })
 
+    if background_tasks:
+        # Scrobble history catches up from its cursor after the response is sent
+        background_tasks.add_task(ingest_lastfm_scrobbles, username)
+
     if not did_push and background_tasks:
-        background_tasks.add_task(process_lastfm_enhancement_background, username, time_range, result, extended, force_sync)
+        background_tasks.add_task(process_lastfm_enhancement_background, username, time_range, result, extended, force_sync, enhance_id=enhance_id)
         print(f"LASTFM SYNC: Fast sync success for {username}. Local background task triggered (Force: {force_sync}).")
     elif did_push:
         print(f"LASTFM SYNC: Fast sync success for {username}. QStash enhancement triggered (Force: {force_sync}).")
     else:
         # Fallback to sync if no other choice
-        process_lastfm_enhancement_background(username, time_range, result, extended, force_sync)
+        process_lastfm_enhancement_background(username, time_range, result, extended, force_sync, enhance_id=enhance_id)
         
     return result
@@ -0,0 +1,149 @@
+import os
+import re
+import sys
+import time
+import sqlite3
+import threading
+
+# Local, read-only copy of the LRCLib database (built from the public dump, see `ingest`).
+# fetch_lrclib_lyrics checks it before calling lrclib.net, so lookups don't need the network.
+# Disabled unless LRCLIB_LOCAL_DB points at an ingested file.
+LRCLIB_LOCAL_DB = os.getenv("LRCLIB_LOCAL_DB")
+
+_local = threading.local()
+_available = None
+
+def normalise(text):
+    """Lowercase, drop version suffixes (" - Remastered", " (Live)", " [Demo]"), punctuation and extra spaces."""
+    t = (text or "").split(" - ")[0].split(" (")[0].split(" [")[0]
+    t = re.sub(r"[^\w\s]", "", t.lower())
+    return " ".join(t.split())
+
+def _is_available():
+    global _available
+    if _available is None:
+        _available = bool(LRCLIB_LOCAL_DB) and os.path.exists(LRCLIB_LOCAL_DB)
+        if LRCLIB_LOCAL_DB:
+            print(f"LRCLIB LOCAL: {'USING' if _available else 'MISSING'} {LRCLIB_LOCAL_DB}")
+    return _available
+
+def _get_conn():
+    # sqlite3 connections are not shareable across threads; keep one read-only connection per thread
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(f"file:{LRCLIB_LOCAL_DB}?mode=ro", uri=True, check_same_thread=False)
+        _local.conn = conn
+    return conn
+
+# Trailing words that only mark a version of the same recording ("home remastered 2011", "hello live")
+_VERSION_WORDS = {
+    "remaster", "remastered", "live", "acoustic", "demo", "version", "edit", "radio",
+    "mono", "stereo", "mix", "remix", "single", "album", "explicit", "clean", "deluxe"
+}
+
+def _strip_version_words(key):
+    words = key.split()
+    while words and (words[-1] in _VERSION_WORDS or (words[-1].isdigit() and len(words[-1]) == 4)):
+        words.pop()
+    return " ".join(words)
+
+def _fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+def get_local_lyrics(track_name, artist_name):
+    """
+    Look up plain lyrics in the local LRCLib copy.
+    Exact normalised (artist, track) key first, then full-text candidates for the artist, accepted
+    only when their title is the same once version words ("remastered", "live", a year) are dropped.
+    Containing the query tokens is not enough: "home" must not match "home sweet home".
+    Returns lyrics or None.
+    """
+    if not _is_available():
+        return None
+    t_key, a_key = normalise(track_name), normalise(artist_name)
+    if not t_key or not a_key:
+        return None
+    try:
+        cur = _get_conn().cursor()
+        cur.execute("SELECT plain_lyrics FROM lyrics WHERE artist_key = ? AND track_key = ?", (a_key, t_key))
+        row = cur.fetchone()
+        if row:
+            return row[0]
+
+        cur.execute("""
+            SELECT l.track_key, l.plain_lyrics FROM lyrics_fts f
+            JOIN lyrics l ON l.rowid = f.rowid
+            WHERE lyrics_fts MATCH ? AND l.artist_key = ?
+            ORDER BY rank LIMIT 10
+        """, (f"track_key:{_fts_phrase(t_key)} AND artist_key:{_fts_phrase(a_key)}", a_key))
+        wanted = _strip_version_words(t_key)
+        for track_key, lyrics in cur.fetchall():
+            if _strip_version_words(track_key) == wanted:
+                return lyrics
+        return None
+    except Exception as e:
+        print(f"LRCLIB LOCAL ERROR: {e}")
+        return None
+
+def ingest(dump_path, target_path):
+    """
+    Build the local lookup database from an LRCLib SQLite dump (https://lrclib.net/db-dumps).
+    Writes to a temp file and swaps it in atomically, so a running app never sees a half-built DB.
+    """
+    start = time.time()
+    tmp_path = f"{target_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    conn.create_function("normalise", 1, normalise, deterministic=True)
+    conn.executescript("""
+        PRAGMA journal_mode = OFF;
+        PRAGMA synchronous = OFF;
+        CREATE TABLE lyrics (
+            artist_key TEXT NOT NULL,
+            track_key TEXT NOT NULL,
+            artist_name TEXT,
+            track_name TEXT,
+            plain_lyrics TEXT NOT NULL,
+            PRIMARY KEY (artist_key, track_key)
+        );
+    """)
+    conn.execute("ATTACH DATABASE ? AS dump", (dump_path,))
+    print(f"LRCLIB INGEST: COPYING TRACKS FROM {dump_path}...")
+    # One row per normalised key; the first (lowest track id) wins.
+    conn.execute("""
+        INSERT OR IGNORE INTO lyrics (artist_key, track_key, artist_name, track_name, plain_lyrics)
+        SELECT normalise(t.artist_name), normalise(t.name), t.artist_name, t.name, l.plain_lyrics
+        FROM dump.tracks t
+        JOIN dump.lyrics l ON l.id = t.last_lyrics_id
+        WHERE l.plain_lyrics IS NOT NULL AND l.plain_lyrics != ''
+        ORDER BY t.id
+    """)
+    conn.commit()
+    conn.execute("DETACH DATABASE dump")
+
+    print("LRCLIB INGEST: BUILDING FULL-TEXT INDEX...")
+    conn.executescript("""
+        CREATE VIRTUAL TABLE lyrics_fts USING fts5(
+            artist_key, track_key, content='lyrics', content_rowid='rowid'
+        );
+        INSERT INTO lyrics_fts(lyrics_fts) VALUES ('rebuild');
+        INSERT INTO lyrics_fts(lyrics_fts) VALUES ('optimize');
+    """)
+    conn.commit()
+    count = conn.execute("SELECT COUNT(*) FROM lyrics").fetchone()[0]
+    conn.execute("VACUUM")
+    conn.close()
+
+    os.replace(tmp_path, target_path)
+    print(f"LRCLIB INGEST: DONE. {count} TRACKS IN {time.time() - start:.0f}s -> {target_path}")
+    return count
+
+if __name__ == "__main__":
+    # python -m app.lrclib_handler ingest <lrclib-db-dump.sqlite3> [target.sqlite3]
+    if len(sys.argv) < 3 or sys.argv[1] != "ingest":
+        print("USAGE: python -m app.lrclib_handler ingest <lrclib-db-dump.sqlite3> [target.sqlite3]")
+        sys.exit(1)
+    target = sys.argv[3] if len(sys.argv) > 3 else (LRCLIB_LOCAL_DB or "lrclib_local.sqlite3")
+    ingest(sys.argv[2], target)
@@ -0,0 +1,173 @@
+import os
+import sys
+import time
+
+# Pluggable lyrics extraction for Genius song pages.
+# Engines (fastest first): selectolax (Lexbor, C) -> lxml (libxml2, C) -> BeautifulSoup (pure Python fallback).
+# Every engine reproduces the BeautifulSoup behaviour used by get_lyrics_by_id:
+#   - text of every div[data-lyrics-container], <br> -> "\n", strings joined with "\n"
+#   - containers mentioning "translation" are skipped
+#   - script/style contents and HTML comments are ignored
+#   - legacy div.lyrics is used when no container yields text
+# Override the engine with LYRICS_PARSER=selectolax|lxml|bs4.
+
+try:
+    from selectolax.lexbor import LexborHTMLParser # type: ignore
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import lxml.html # type: ignore
+except ImportError:
+    lxml = None
+
+from bs4 import BeautifulSoup
+
+_SKIP_TAGS = ("script", "style")
+
+def _join_lines(blocks):
+    all_lines = []
+    for block in blocks:
+        block = block.strip()
+        if not block: continue
+        for line in block.split("\n"):
+            stripped = line.strip()
+            if stripped: all_lines.append(stripped)
+            else: all_lines.append("")
+    return "\n".join(all_lines)
+
+# --- BeautifulSoup (reference) ---
+
+def _extract_bs4(html):
+    soup = BeautifulSoup(html, "html.parser")
+    blocks = []
+    for c in soup.select("div[data-lyrics-container]"):
+        if "translation" in c.get_text().lower(): continue
+        for br in c.find_all("br"): br.replace_with("\n")
+        blocks.append(c.get_text("\n"))
+    lyrics_raw = _join_lines(blocks)
+
+    if not lyrics_raw.strip():
+        old = soup.find("div", class_="lyrics")
+        if old: lyrics_raw = old.get_text("\n")
+    return lyrics_raw
+
+# --- lxml ---
+
+def _lxml_strings(el, with_br):
+    """Text nodes under el in document order (bs4 get_text semantics), optionally emitting "\n" per <br>."""
+    out = []
+
+    def walk(node):
+        tag = node.tag
+        if not isinstance(tag, str) or tag in _SKIP_TAGS:
+            return # Comments / script / style: drop content (the tail is handled by the parent)
+        if tag == "br":
+            if with_br: out.append("\n")
+            return
+        if node.text: out.append(node.text)
+        for child in node:
+            walk(child)
+            if child.tail: out.append(child.tail)
+
+    walk(el)
+    return out
+
+def _extract_lxml(html):
+    root = lxml.html.fromstring(html)
+    blocks = []
+    for c in root.xpath("//div[@data-lyrics-container]"):
+        if "translation" in "".join(_lxml_strings(c, False)).lower(): continue
+        blocks.append("\n".join(_lxml_strings(c, True)))
+    lyrics_raw = _join_lines(blocks)
+
+    if not lyrics_raw.strip():
+        old = root.xpath("//div[contains(concat(' ', normalize-space(@class), ' '), ' lyrics ')]")
+        if old: lyrics_raw = "\n".join(_lxml_strings(old[0], False))
+    return lyrics_raw
+
+# --- selectolax ---
+
+def _selectolax_strings(el, with_br):
+    out = []
+    for node in el.traverse(include_text=True):
+        tag = node.tag
+        if tag == "-text":
+            parent = node.parent
+            if parent is not None and parent.tag in _SKIP_TAGS: continue
+            text = node.text_content
+            if text: out.append(text)
+        elif tag == "br" and with_br:
+            out.append("\n")
+    return out
+
+def _extract_selectolax(html):
+    tree = LexborHTMLParser(html)
+    blocks = []
+    for c in tree.css("div[data-lyrics-container]"):
+        if "translation" in "".join(_selectolax_strings(c, False)).lower(): continue
+        blocks.append("\n".join(_selectolax_strings(c, True)))
+    lyrics_raw = _join_lines(blocks)
+
+    if not lyrics_raw.strip():
+        old = tree.css_first("div.lyrics")
+        if old is not None: lyrics_raw = "\n".join(_selectolax_strings(old, False))
+    return lyrics_raw
+
+ENGINES = {"bs4": _extract_bs4}
+if lxml is not None:
+    ENGINES["lxml"] = _extract_lxml
+if LexborHTMLParser is not None:
+    ENGINES["selectolax"] = _extract_selectolax
+
+def _pick_engine():
+    wanted = os.getenv("LYRICS_PARSER", "auto").lower()
+    if wanted in ENGINES:
+        return wanted
+    if wanted != "auto":
+        print(f"LYRICS EXTRACTOR: '{wanted}' NOT AVAILABLE, AUTO-SELECTING.")
+    for name in ("selectolax", "lxml", "bs4"):
+        if name in ENGINES:
+            return name
+    return "bs4"
+
+ACTIVE_ENGINE = _pick_engine()
+print(f"LYRICS EXTRACTOR: USING '{ACTIVE_ENGINE}' ENGINE.")
+
+def extract_lyrics_html(html, engine=None):
+    """
+    Return the raw (uncleaned) lyrics text of a Genius song page.
+    Falls back to BeautifulSoup if the fast engine raises.
+    """
+    name = engine or ACTIVE_ENGINE
+    if name != "bs4":
+        try:
+            return ENGINES[name](html)
+        except Exception as e:
+            print(f"LYRICS EXTRACTOR ({name}) FAILED, FALLING BACK TO BS4: {e}")
+    return _extract_bs4(html)
+
+if __name__ == "__main__":
+    # Benchmark: python -m app.lyrics_extractor saved_page1.html saved_page2.html ... [--runs N]
+    args = sys.argv[1:]
+    runs = 20
+    if "--runs" in args:
+        i = args.index("--runs")
+        runs = int(args[i + 1])
+        args = args[:i] + args[i + 2:]
+    if not args:
+        print("USAGE: python -m app.lyrics_extractor <page.html> [...] [--runs N]")
+        sys.exit(1)
+
+    for path in args:
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        reference = _extract_bs4(html)
+        print(f"\n{path} ({len(html) / 1024:.0f} KB, {len(reference.splitlines())} lines)")
+        for name, fn in ENGINES.items():
+            start = time.perf_counter()
+            for _ in range(runs):
+                out = fn(html)
+            ms = (time.perf_counter() - start) * 1000 / runs
+            match = "OK" if out == reference else "MISMATCH"
+            print(f"  {name:<10} {ms:8.2f} ms/page   {match}")
@@ -1,5 +1,5 @@
 import os
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 
@@ -48,6 +48,19 @@ def save_user_sync(spotify_id, time_range, data):
         upsert=True
     )
 
+def save_user_syncs(spotify_id, data_by_range):
+    """Upsert several time ranges for one user in a single bulk write."""
+    if not data_by_range: return
+    now = datetime.now(timezone.utc)
+    get_db()["user_syncs"].bulk_write([
+        UpdateOne(
+            {'spotify_id': spotify_id, 'time_range': time_range},
+            {'$set': {'data': data, 'last_synced': now}},
+            upsert=True
+        )
+        for time_range, data in data_by_range.items()
+    ], ordered=False)
+
 def get_user_history(spotify_id):
     collection = get_db()["user_syncs"]
     history = collection.find({'spotify_id': spotify_id}, {'_id': 0}).sort('last_synced', -1)
@@ -3,7 +3,8 @@ import threading
 import os
 import re
 import time
-import requests
+import hashlib
+from app import http_handler
 from dotenv import load_dotenv
 from huggingface_hub import InferenceClient
 
@@ -15,6 +16,11 @@ SPACE_URL = "https://anggars-mbti-emotion.hf.space/gradio_api"
 MODEL_ROBERTA = "SamLowe/roberta-base-go_emotions"
 MODEL_DISTILBERT = "joeddav/distilbert-base-uncased-go-emotions-student"
 
+# Tag for the content-addressed analysis cache (nlp:<version>:<lyrics hash>).
+# Bump this whenever the Space model or its post-processing changes.
+ANALYSIS_MODEL_VERSION = os.getenv("ANALYSIS_MODEL_VERSION", "mbti-emotion-space-v1")
+FALLBACK_MODEL_VERSION = "hf-hybrid-fallback-v1"
+
 # Global HF Client (Synchronous for fallback, can be used in threads)
 if HF_API_KEY:
     try:
@@ -80,6 +86,11 @@ MBTI_CONNECTORS = {
     "default": "reflected in",
 }
 
+# Fixed label order for the compact score vectors stored in Postgres (track_analysis).
+# Neutral (id 27) is always filtered out before results are stored.
+EMOTION_VECTOR_LABELS = [GO_EMOTIONS_ID_MAP[str(i)] for i in range(27)]
+MBTI_VECTOR_LABELS = sorted(k for k in MBTI_CONNECTORS if k != "default")
+
 _analysis_cache = {}
 _cache_lock = threading.Lock()
 
@@ -108,6 +119,90 @@ def _map_label(label: str) -> str:
         return GO_EMOTIONS_ID_MAP.get(idx, label)
     return label
 
+def lyrics_fingerprint(text: str) -> str:
+    """
+    Content hash of normalised lyrics. Case, punctuation, [Section] headers and
+    whitespace are ignored so covers/remasters/live versions share one hash.
+    """
+    if not text or not text.strip():
+        return ""
+    norm = re.sub(r"\[[^\]]*\]", " ", text.lower())
+    norm = re.sub(r"[^\w\s]", "", norm)
+    norm = " ".join(norm.split())
+    return hashlib.sha256(norm.encode("utf-8")).hexdigest()
+
+
+def encode_score_vector(items, labels):
+    """[{"label", "score"}, ...] -> fixed-order list of floats (None if empty)."""
+    if not items:
+        return None
+    lookup = {i["label"]: float(i.get("score", 0)) for i in items}
+    return [round(lookup.get(label, 0.0), 5) for label in labels]
+
+def decode_score_vector(vector, labels):
+    """Inverse of encode_score_vector, sorted by score (None if empty)."""
+    if not vector:
+        return None
+    out = [{"label": label, "score": float(score)} for label, score in zip(labels, vector) if score]
+    out.sort(key=lambda x: x["score"], reverse=True)
+    return out
+
+def _track_key(display_name: str) -> str:
+    return display_name.lower().strip()
+
+def _load_track_analyses(display_names):
+    """
+    Read-through for per-track results: Redis first, then ONE batch SELECT on
+    track_analysis for everything Redis missed. DB hits are written back to Redis.
+    Returns {display_name: (emotions, mbti)}.
+    """
+    from app.cache_handler import get_analysis_cache, set_analysis_cache
+    from app.db_handler import get_track_analyses_batch
+
+    found = {}
+    misses = []
+    for d_name in display_names:
+        cached = get_analysis_cache(d_name)
+        if cached:
+            found[d_name] = (cached[0], cached[1])
+        else:
+            misses.append(d_name)
+
+    if misses:
+        try:
+            rows = get_track_analyses_batch([_track_key(d) for d in misses], ANALYSIS_MODEL_VERSION)
+        except Exception as e:
+            print(f"NLP HANDLER: track_analysis lookup failed: {e}")
+            rows = {}
+        for d_name in misses:
+            row = rows.get(_track_key(d_name))
+            if not row:
+                continue
+            emo = decode_score_vector(row["emotion_scores"], EMOTION_VECTOR_LABELS)
+            mbti = decode_score_vector(row["mbti_scores"], MBTI_VECTOR_LABELS)
+            if emo:
+                found[d_name] = (emo, mbti)
+                set_analysis_cache(d_name, [emo, mbti])
+        if rows:
+            print(f"NLP HANDLER: {len(rows)}/{len(misses)} Redis misses served from track_analysis.")
+    return found
+
+def _store_track_analysis(display_name, lyrics_hash, source, emotions, mbti):
+    """Write-through: Redis hot tier + durable track_analysis row."""
+    from app.cache_handler import set_analysis_cache
+    from app.db_handler import save_track_analysis
+
+    set_analysis_cache(display_name, [emotions, mbti])
+    # Fallback results (no MBTI) come from different models, tag them so they are never served as current.
+    model_version = ANALYSIS_MODEL_VERSION if mbti else FALLBACK_MODEL_VERSION
+    try:
+        save_track_analysis(
+            _track_key(display_name), lyrics_hash, model_version, source,
+            encode_score_vector(emotions, EMOTION_VECTOR_LABELS),
+            encode_score_vector(mbti, MBTI_VECTOR_LABELS)
+        )
+    except Exception as e:
+        print(f"NLP HANDLER: track_analysis save failed for '{display_name}': {e}")
 
 def _run_fallback_hybrid_analysis(text: str):
     """
@@ -221,16 +316,38 @@ def get_emotion_from_text(text: str):
     if text in _analysis_cache:
         return _analysis_cache[text]
 
+    # Content-addressed layer: identical lyrics (covers, remasters, live versions)
+    # analysed by the same model version skip inference entirely.
+    from app.cache_handler import get_lyrics_analysis_cache, set_lyrics_analysis_cache
+    lyrics_hash = lyrics_fingerprint(text)
+    shared = get_lyrics_analysis_cache(lyrics_hash, ANALYSIS_MODEL_VERSION)
+    if not shared:
+        try:
+            from app.db_handler import get_track_analysis_by_hash
+            row = get_track_analysis_by_hash(lyrics_hash, ANALYSIS_MODEL_VERSION)
+            if row and row["emotion_scores"]:
+                shared = [
+                    decode_score_vector(row["emotion_scores"], EMOTION_VECTOR_LABELS),
+                    decode_score_vector(row["mbti_scores"], MBTI_VECTOR_LABELS)
+                ]
+                set_lyrics_analysis_cache(lyrics_hash, ANALYSIS_MODEL_VERSION, shared)
+        except Exception as e:
+            print(f"NLP HANDLER: track_analysis hash lookup failed: {e}")
+    if shared:
+        print(f"NLP HANDLER: LYRICS HASH HIT ({lyrics_hash[:12]}, {ANALYSIS_MODEL_VERSION}).")
+        _analysis_cache[text] = (shared[0], shared[1])
+        return shared[0], shared[1]
+
     try:
         import json as _json
-        
+
         # Submit job
         submit_url = f"{SPACE_URL}/call/predict"
         headers = {"Content-Type": "application/json"}
         if HF_API_KEY:
             headers["Authorization"] = f"Bearer {HF_API_KEY}"
         
-        submit_resp = requests.post(
+        submit_resp = http_handler.post(
             submit_url,
             json={"data": [text]},
             headers=headers,
@@ -242,7 +359,7 @@ def get_emotion_from_text(text: str):
         
         event_id = submit_resp.json().get("event_id")
         result_url = f"{SPACE_URL}/call/predict/{event_id}"
-        result_resp = requests.get(result_url, headers=headers, timeout=120, stream=True)
+        result_resp = http_handler.get(result_url, headers=headers, timeout=120, stream=True)
         
         emo_data = None
         mbti_data = None
@@ -283,6 +400,8 @@ def get_emotion_from_text(text: str):
         mbti.sort(key=lambda x: x["score"], reverse=True)
         
         _analysis_cache[text] = (emotions, mbti)
+        # Only full Space results are content-addressed; fallback output comes from different models.
+        set_lyrics_analysis_cache(lyrics_hash, ANALYSIS_MODEL_VERSION, [emotions, mbti])
         print(f"NLP HANDLER: SPACE OK -> Top Emo: {emotions[0]['label'] if emotions else '?'}, Top MBTI: {mbti[0]['label'] if mbti else '?'}")
         return emotions, mbti
 
@@ -380,8 +499,7 @@ def generate_sentiment_analysis(tracks, progress_callback=None, extended=False):
     num_tracks = len(tracks) if extended else min(10, len(tracks))
     tracks_to_analyze = tracks[:num_tracks]
 
-    from app.genius_lyrics import search_track_lyrics, fetch_lrclib_lyrics
-    from app.cache_handler import get_analysis_cache, set_analysis_cache
+    from app.genius_lyrics import resolve_track_lyrics
 
     log_output = "\n" + "="*50 + "\n"
     log_output += " NLP SENTIMENT ANALYSIS REPORT\n"
@@ -391,10 +509,7 @@ def generate_sentiment_analysis(tracks, progress_callback=None, extended=False):
     all_mbti_accum = {}
     successful_analyses = 0
 
-    for idx, track in enumerate(tracks_to_analyze):
-        if not isinstance(track, dict):
-            continue
-
+    def _names(track):
         t_name = track.get("name", "")
         a_name = ""
         raw_a = track.get("artist") or track.get("artists")
@@ -405,8 +520,22 @@ def generate_sentiment_analysis(tracks, progress_callback=None, extended=False):
             a_name = raw_a.get("name", "")
         elif raw_a:
             a_name = str(raw_a)
+        return t_name, a_name, (f"{t_name} by {a_name}" if a_name else t_name)
+
+    # --- PREFETCH (Redis, then one batch SELECT on track_analysis for the misses) ---
+    display_names = [_names(t)[2] for t in tracks_to_analyze if isinstance(t, dict)]
+    with _cache_lock:
+        pending = [d for d in display_names if d not in _analysis_cache]
+    if pending:
+        prefetched = _load_track_analyses(pending)
+        with _cache_lock:
+            _analysis_cache.update(prefetched)
+
+    for idx, track in enumerate(tracks_to_analyze):
+        if not isinstance(track, dict):
+            continue
 
-        d_name = f"{t_name} by {a_name}" if a_name else t_name
+        t_name, a_name, d_name = _names(track)
 
         # --- PROGRESS UPDATE (Ordered) ---
         # Call it here at the START of processing each track
@@ -420,17 +549,10 @@ def generate_sentiment_analysis(tracks, progress_callback=None, extended=False):
             except:
                 pass
 
-        # --- CACHE CHECK (always first, regardless of position) ---
+        # --- CACHE CHECK (always first, regardless of position; filled by the prefetch above) ---
         with _cache_lock:
             cached = _analysis_cache.get(d_name)
 
-        if not cached:
-            cached = get_analysis_cache(d_name)
-            if cached:
-                with _cache_lock:
-                    _analysis_cache[d_name] = (cached[0], cached[1])
-                print(f"NLP: Cache Hit for '{d_name}'.")
-
         if cached:
             emo, mbti_r = cached[0], cached[1]
             
@@ -452,6 +574,7 @@ def generate_sentiment_analysis(tracks, progress_callback=None, extended=False):
         # --- LYRICS FETCH (Genius primary, LRCLib fallback, skip if none) ---
 
         lyrics = None
+        lyrics_source = None
 
         # Skip known instrumentals
         is_instrumental = (
@@ -463,7 +586,7 @@ def generate_sentiment_analysis(tracks, progress_callback=None, extended=False):
         if not is_instrumental:
             # Try combined search (LRCLib -> Genius -> Google)
             try:
-                lyrics = search_track_lyrics(t_name, a_name)
+                lyrics, lyrics_source = resolve_track_lyrics(t_name, a_name)
             except:
                 pass
 
@@ -486,7 +609,7 @@ def generate_sentiment_analysis(tracks, progress_callback=None, extended=False):
             if emo:
                 with _cache_lock:
                     _analysis_cache[d_name] = (emo, mbti_r)
-                set_analysis_cache(d_name, [emo, mbti_r])
+                _store_track_analysis(d_name, lyrics_fingerprint(txt), lyrics_source, emo, mbti_r)
                 
                 log_output += f"ANALYSIS SUCCESS FOR '{d_name}'.\n"
                 log_output += f"Fresh Track Scores -> Emotions: {emo} | MBTI: {mbti_r}\n\n"
@@ -16,7 +16,7 @@ def get_qstash_receiver():
     )
 
 def publish_to_qstash(target_path: str, data: dict):
-    import requests
+    from app import http_handler
     import json
     
     app_url = os.getenv("APP_URL", "http://127.0.0.1:8000")
@@ -39,7 +39,7 @@ def publish_to_qstash(target_path: str, data: dict):
     }
     
     try:
-        res = requests.post(qstash_url, headers=headers, json=data, timeout=10)
+        res = http_handler.post(qstash_url, headers=headers, json=data, timeout=10)
         if res.status_code < 300:
             print(f"QSTASH: Task queued successfully for {target_path}")
             return True
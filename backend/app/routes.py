@@ -1,12 +1,12 @@
 import os
-import requests
+from app import http_handler
 import json
 import datetime
 from datetime import timezone
 import asyncio
 from urllib.parse import urlencode
 from fastapi import APIRouter, Request, Query, HTTPException, Body, BackgroundTasks
-from fastapi.responses import JSONResponse, RedirectResponse, HTMLResponse, Response, PlainTextResponse
+from fastapi.responses import JSONResponse, RedirectResponse, HTMLResponse, Response, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from typing import Optional
 import smtplib
@@ -17,18 +17,15 @@ import base64
 from app.nlp_handler import generate_sentiment_analysis, analyze_lyrics_emotion
 from app.admin import get_system_wide_stats, get_user_report, export_users_to_csv
 from app.db_handler import (
-    save_user,
-    save_artists_batch,
-    save_tracks_batch,
-    save_user_associations_batch,
+    save_sync_batch,
     log_system,
     save_refresh_token,
     get_refresh_token
 )
-from app.cache_handler import cache_top_data, get_cached_top_data, clear_top_data_cache, r as redis_client
-from app.mongo_handler import save_user_sync, get_user_history, get_active_provider, set_active_provider
+from app.cache_handler import cache_top_data, cache_top_data_many, get_cached_top_data, clear_top_data_cache, r as redis_client
+from app.mongo_handler import save_user_syncs, get_user_history, get_active_provider, set_active_provider
 from app.qstash_handler import get_qstash_client, get_qstash_receiver
-from app.genius_lyrics import get_suggestions, search_artist_id, get_songs_by_artist, get_lyrics_by_id, search_track_lyrics
+from app.genius_lyrics import get_suggestions, search_artist_id, get_songs_by_artist, get_artist_songs_page, get_lyrics_by_id, search_track_lyrics
 from app.lastfm_handler import sync_lastfm_user_data
 
 # Request Access Model
@@ -147,7 +144,7 @@ def request_access(data: RequestAccessModel):
             "parse_mode": "Markdown"
         }
         
-        res = requests.post(telegram_url, json=payload)
+        res = http_handler.post(telegram_url, json=payload)
         
         if res.status_code != 200:
             print(f"TELEGRAM ERROR: {res.text}")
@@ -351,7 +348,7 @@ def callback(request: Request, code: str = Query(..., description="Spotify Autho
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
     
     try:
-        res = requests.post("https://accounts.spotify.com/api/token", data=payload, headers=headers)
+        res = http_handler.post("https://accounts.spotify.com/api/token", data=payload, headers=headers)
         if res.status_code != 200:
             print(f"AUTH ERROR: Token Exchange Failed: {res.text}")
             return error_redirect("token_error")
@@ -368,7 +365,10 @@ def callback(request: Request, code: str = Query(..., description="Spotify Autho
         token_expires_at = datetime.datetime.now(timezone.utc) + datetime.timedelta(seconds=expires_in)
 
         headers = {"Authorization": f"Bearer {access_token}"}
-        user_res = requests.get("https://api.spotify.com/v1/me", headers=headers)
+        time_ranges = ["short_term", "medium_term", "long_term"]
+
+        # Profile first: a user who isn't whitelisted costs a single Spotify call
+        user_res = http_handler.get("https://api.spotify.com/v1/me", headers=headers)
         if user_res.status_code != 200:
             print(f"AUTH ERROR: Profile Fetch Failed: {user_res.text}")
             # Likely not whitelisted
@@ -378,55 +378,51 @@ def callback(request: Request, code: str = Query(..., description="Spotify Autho
         spotify_id = user_profile["id"]
         display_name = user_profile.get("display_name", "Unknown")
         user_image = safe_get_image(user_profile.get("images"))
-        
-        save_user(spotify_id, display_name)
-        
-        # NEW: Force fresh sync by clearing existing cache for this user during login
-        try:
-            from app.cache_handler import hard_clear_user_cache
-            hard_clear_user_cache(spotify_id)
-            print(f"CALLBACK: Hard cleared cache (dashboard + NLP analysis) for {spotify_id}")
-        except Exception as e:
-            print(f"CACHE HARD CLEAR ERROR on Spotify Login: {e}")
 
-        # Save refresh token if available
-        if refresh_token:
-            save_refresh_token(spotify_id, refresh_token, token_expires_at)
+        # Top artists/tracks for every range in parallel: one more round trip
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=2 * len(time_ranges)) as executor:
+            top_futures = {
+                time_range: (
+                    executor.submit(http_handler.get, f"https://api.spotify.com/v1/me/top/artists?time_range={time_range}&limit=20", headers=headers),
+                    executor.submit(http_handler.get, f"https://api.spotify.com/v1/me/top/tracks?time_range={time_range}&limit=20", headers=headers)
+                )
+                for time_range in time_ranges
+            }
 
-        time_ranges = ["short_term", "medium_term", "long_term"]
+        # Artists/tracks overlap heavily between ranges: keep one row per id, upsert once
+        artists_to_save = {}
+        tracks_to_save = {}
+        results = {}
         for time_range in time_ranges:
-            artist_resp = requests.get(f"https://api.spotify.com/v1/me/top/artists?time_range={time_range}&limit=20", headers=headers)
+            try:
+                artist_resp, track_resp = (f.result() for f in top_futures[time_range])
+            except Exception as range_err:
+                print(f"CALLBACK: Skipping {time_range}, top data request failed: {range_err}")
+                continue
+            if artist_resp.status_code != 200 or track_resp.status_code != 200:
+                # Leave this range uncached; the dashboard syncs it on first view
+                print(f"CALLBACK: Skipping {time_range} (artists {artist_resp.status_code}, tracks {track_resp.status_code})")
+                continue
             artists = artist_resp.json().get("items", [])
-            track_resp = requests.get(f"https://api.spotify.com/v1/me/top/tracks?time_range={time_range}&limit=20", headers=headers)
             tracks = track_resp.json().get("items", [])
 
-            artists_to_save = []
-            artist_ids = []
             for artist in artists:
-                artist_ids.append(artist["id"])
-                artists_to_save.append((
+                artists_to_save[artist["id"]] = (
                     artist["id"],
                     artist["name"],
                     artist["popularity"],
                     safe_get_image(artist.get("images"))
-                ))
+                )
 
-            tracks_to_save = []
-            track_ids = []
             for track in tracks:
-                track_ids.append(track["id"])
-                tracks_to_save.append((
+                tracks_to_save[track["id"]] = (
                     track["id"],
                     track["name"],
                     track["popularity"],
                     track.get("preview_url"),
                     safe_get_image(track.get("album", {}).get("images"), "")
-                ))
-
-            save_artists_batch(artists_to_save)
-            save_tracks_batch(tracks_to_save)
-            save_user_associations_batch("user_artists", "artist_id", spotify_id, artist_ids)
-            save_user_associations_batch("user_tracks", "track_id", spotify_id, track_ids)
+                )
 
             # FIX: Include image in result
             result = {"user": display_name, "image": user_image, "artists": [], "tracks": []}
@@ -458,8 +454,30 @@ def callback(request: Request, code: str = Query(..., description="Spotify Autho
 
             # Sentiment report will be assigned by a background worker later
             result['sentiment_report'] = ""
-            cache_top_data("top", spotify_id, time_range, result)
-            save_user_sync(spotify_id, time_range, result)
+            results[time_range] = result
+
+        # User, artists, tracks and associations in one transaction
+        save_sync_batch(
+            spotify_id, display_name,
+            list(artists_to_save.values()), list(tracks_to_save.values()),
+            list(artists_to_save), list(tracks_to_save)
+        )
+        
+        # NEW: Force fresh sync by clearing existing cache for this user during login
+        try:
+            from app.cache_handler import hard_clear_user_cache
+            hard_clear_user_cache(spotify_id)
+            print(f"CALLBACK: Hard cleared cache (dashboard + NLP analysis) for {spotify_id}")
+        except Exception as e:
+            print(f"CACHE HARD CLEAR ERROR on Spotify Login: {e}")
+
+        # Save refresh token if available
+        if refresh_token:
+            save_refresh_token(spotify_id, refresh_token, token_expires_at)
+
+        # Every fetched range: one Redis pipeline, one Mongo bulk write
+        cache_top_data_many("top", spotify_id, results)
+        save_user_syncs(spotify_id, results)
             
     except Exception as e:
         import traceback
@@ -589,7 +607,7 @@ def refresh_access_token(
             "Content-Type": "application/x-www-form-urlencoded"
         }
         
-        res = requests.post("https://accounts.spotify.com/api/token", data=payload, headers=headers, timeout=5)
+        res = http_handler.post("https://accounts.spotify.com/api/token", data=payload, headers=headers, timeout=5)
         
         if res.status_code != 200:
             error_data = res.json() if res.text else {}
@@ -681,7 +699,7 @@ def get_currently_playing(spotify_id: str, request: Request):
         }
         headers = {"Content-Type": "application/x-www-form-urlencoded"}
         
-        token_res = requests.post("https://accounts.spotify.com/api/token", data=payload, headers=headers)
+        token_res = http_handler.post("https://accounts.spotify.com/api/token", data=payload, headers=headers)
         if token_res.status_code != 200:
             return {"is_playing": False, "error": "Token refresh failed"}
         
@@ -697,7 +715,7 @@ def get_currently_playing(spotify_id: str, request: Request):
         
         # Call Spotify currently playing endpoint
         spotify_headers = {"Authorization": f"Bearer {access_token}"}
-        player_res = requests.get("https://api.spotify.com/v1/me/player/currently-playing", headers=spotify_headers)
+        player_res = http_handler.get("https://api.spotify.com/v1/me/player/currently-playing", headers=spotify_headers)
         
         if player_res.status_code == 204:
             # No content - nothing playing
@@ -784,7 +802,7 @@ def get_user_profile(spotify_id: str, request: Request):
         }
         headers = {"Content-Type": "application/x-www-form-urlencoded"}
         
-        token_res = requests.post("https://accounts.spotify.com/api/token", data=payload, headers=headers)
+        token_res = http_handler.post("https://accounts.spotify.com/api/token", data=payload, headers=headers)
         if token_res.status_code != 200:
             return {"error": "Token refresh failed", "user": None, "image": None}
         
@@ -793,7 +811,7 @@ def get_user_profile(spotify_id: str, request: Request):
         
         # Fetch user profile from Spotify
         spotify_headers = {"Authorization": f"Bearer {access_token}"}
-        user_res = requests.get("https://api.spotify.com/v1/me", headers=spotify_headers)
+        user_res = http_handler.get("https://api.spotify.com/v1/me", headers=spotify_headers)
         
         if user_res.status_code != 200:
             return {"error": "Failed to fetch profile", "user": None, "image": None}
@@ -933,7 +951,7 @@ def sync_top_data(
                     }
                     headers = {"Content-Type": "application/x-www-form-urlencoded"}
                     
-                    res = requests.post("https://accounts.spotify.com/api/token", data=payload, headers=headers)
+                    res = http_handler.post("https://accounts.spotify.com/api/token", data=payload, headers=headers)
                     if res.status_code == 200:
                         tokens = res.json()
                         new_access_token = tokens.get("access_token")
@@ -1034,7 +1052,7 @@ def get_dashboard_data(
                 
                 # Check identity via Spotify
                 try:
-                    user_res = requests.get("https://api.spotify.com/v1/me", headers={"Authorization": f"Bearer {token_from_header}"})
+                    user_res = http_handler.get("https://api.spotify.com/v1/me", headers={"Authorization": f"Bearer {token_from_header}"})
                     if user_res.status_code == 200:
                         user_data = user_res.json()
                         verified_id = user_data.get("id")
@@ -1071,10 +1089,10 @@ def get_dashboard_data(
                 data = get_cached_top_data("top", profile_id, time_range)
             
             if data:
-                # Live fetch user info to keep profile picture instantly synced
+                # Refresh user info (5 min profile cache) to keep profile picture synced
                 try:
-                    from app.lastfm_handler import get_user_info
-                    live_user = get_user_info(username)
+                    from app.lastfm_handler import get_cached_user_info
+                    live_user = get_cached_user_info(username)
                     if live_user:
                         li_name = live_user.get("realname") or live_user.get("name", username)
                         li_img = ""
@@ -1176,7 +1194,7 @@ def get_dashboard_data(
                             "Content-Type": "application/x-www-form-urlencoded"
                         }
                         
-                        res = requests.post("https://accounts.spotify.com/api/token", data=payload, headers=headers, timeout=5)
+                        res = http_handler.post("https://accounts.spotify.com/api/token", data=payload, headers=headers, timeout=5)
                         if res.status_code == 200:
                             tokens = res.json()
                             access_token = tokens.get("access_token")
@@ -1515,6 +1533,37 @@ def trigger_db_sync():
             status_code=500
         )
 
+@router.get("/admin/refresh-media", tags=["Admin"])
+def trigger_media_refresh(limit: int = Query(50, ge=1, le=500)):
+    try:
+        from app.lastfm_handler import refresh_stale_media_metadata
+        meta = refresh_stale_media_metadata(limit=limit)
+
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        RECEIPT_WIDTH = 40
+
+        receipt_lines = []
+        receipt_lines.append("*" * RECEIPT_WIDTH)
+        receipt_lines.append("     MEDIA METADATA REFRESHED     ")
+        receipt_lines.append("*" * RECEIPT_WIDTH)
+        receipt_lines.append(f" DATE: {now}")
+        receipt_lines.append("=" * RECEIPT_WIDTH)
+        receipt_lines.append("\n  STATUS: SUCCESS\n")
+        receipt_lines.append(f" STALE ROWS CHECKED: {meta.get('checked', 0)}")
+        receipt_lines.append(f" IMAGES RESOLVED: {meta.get('found', 0)}")
+        receipt_lines.append("\n\n" + "=" * RECEIPT_WIDTH)
+
+        report_string = "\n".join(receipt_lines)
+        return Response(content=report_string, media_type="text/plain")
+
+    except Exception as e:
+        print(f"ADMIN_REFRESH_MEDIA: FAILED: {e}")
+        return Response(
+            content=f"FAILED TO REFRESH MEDIA METADATA: {str(e)}",
+            media_type="text/plain",
+            status_code=500
+        )
+
 @router.get("/admin/export", tags=["Admin"])
 def download_user_export():
     csv_content = export_users_to_csv()
@@ -1526,6 +1575,22 @@ def download_user_export():
         }
     )
 
+@router.get("/admin/genius-search-metrics", tags=["Admin"])
+def get_genius_search_cache_metrics():
+    """Hit/miss counters for the shared Genius search cache (this instance)."""
+    from app.genius_lyrics import get_genius_search_metrics
+    return JSONResponse(content=get_genius_search_metrics())
+
+@router.get("/admin/http-metrics", tags=["Admin"])
+def get_outbound_http_metrics():
+    """Per-host latency and error stats for outbound integrations (since process start)."""
+    return JSONResponse(content=http_handler.get_http_metrics())
+
+@router.get("/admin/rate-limit-metrics", tags=["Admin"])
+def get_outbound_rate_limit_metrics():
+    """Shared Redis rate-limiter buckets: configured limits, throttling and upstream 429s (this instance)."""
+    return JSONResponse(content=http_handler.get_rate_limit_metrics())
+
 # Endpoint removed (Duplicate)
 
 @router.get("/lyrics", response_class=HTMLResponse, tags=["Pages"])
@@ -1558,12 +1623,30 @@ def api_genius_autocomplete(q: str):
     return {"results": get_suggestions(q)}
 
 @router.get("/api/genius/artist-songs/{artist_id}")
-def api_get_artist_songs(artist_id: int):
+def api_get_artist_songs(artist_id: int, page: Optional[int] = Query(None, ge=1)):
+    # ?page=N returns a single Genius page so the UI can render immediately;
+    # without it the full (cached) discography is returned.
+    if page is not None:
+        result = get_artist_songs_page(artist_id, page)
+        if result is None:
+            return {"songs": [], "next_page": None}
+        return result
     return {"songs": get_songs_by_artist(artist_id)}
 
 @router.get("/api/genius/lyrics/{song_id}")
 def api_get_lyrics_emotion(song_id: int):
-    data = get_lyrics_by_id(song_id)
+    from app.cache_handler import get_or_compute
+    from app.nlp_handler import ANALYSIS_MODEL_VERSION
+
+    # Parsed page and its analysis are cached per song (single-flight), so a popular
+    # song is scraped and analysed once no matter how many users open it.
+    # Page scrape: two 5s fetch attempts plus the API lookup
+    data = get_or_compute(
+        f"genius:song:{song_id}", lambda: get_lyrics_by_id(song_id),
+        ttl=2592000, # 30 days
+        lock_ttl=60,
+        wait_timeout=30
+    )
     if not data:
         log_system("WARN", f"Lyrics Not Found: ID {song_id}", "GENIUS")
         raise HTTPException(status_code=404, detail="Lyrics not found!")
@@ -1573,7 +1656,17 @@ def api_get_lyrics_emotion(song_id: int):
     print("-" * 20)
     print(f"LYRICS CONTENT:\n{data.get('lyrics')}")
     print("="*50)
-    emotion = analyze_lyrics_emotion(data['lyrics'])
+    # Space call: 30s submit + up to 120s result stream, so the lock outlives it.
+    # Only full Space results (with MBTI) are stored under the primary model version;
+    # fallback-model output is returned but not cached.
+    emotion = get_or_compute(
+        f"genius:song_emotion:{ANALYSIS_MODEL_VERSION}:{song_id}",
+        lambda: analyze_lyrics_emotion(data['lyrics']),
+        ttl=2592000,
+        cacheable=lambda v: bool(v) and "error" not in v and "mbti" in v,
+        lock_ttl=180,
+        wait_timeout=160
+    )
     return {
         "track_info": data,
         "lyrics": data['lyrics'],
@@ -1582,63 +1675,45 @@ def api_get_lyrics_emotion(song_id: int):
 
 @router.get("/api/genius/fetch-by-filename")
 def api_fetch_lyrics_by_filename(filename: str):
-    import re
-    import requests
-    from app.genius_lyrics import GENIUS_API_URL, get_headers, get_lyrics_by_id
-    
-    # Remove extension
-    clean_name = re.sub(r'\.[^/.]+$', '', filename).strip()
-    
-    # Remove common downloader prefixes
-    clean_name = re.sub(r'^(SpotiDownloader\.com\s*-\s*|\[.*?\]\s*-\s*|y2mate\.com\s*-\s*)', '', clean_name, flags=re.IGNORECASE).strip()
-    
-    # Clean up hyphen spacing for better Genius search
-    query_name = clean_name.replace(" - ", " ")
+    from app.genius_lyrics import resolve_lyrics_by_filename
+    return {"lyrics": resolve_lyrics_by_filename(filename)}
 
-    # Direct Genius Search (Flexible, handles any order)
-    try:
-        res = requests.get(
-            f"{GENIUS_API_URL}/search",
-            params={"q": query_name},
-            headers=get_headers(),
-            timeout=5
-        )
-        if res.status_code == 200:
-            hits = res.json().get("response", {}).get("hits", [])
-            for hit in hits:
-                if hit["type"] == "song":
-                    result = hit["result"]
-                    title = result.get("title", "").lower()
-                    artist = result.get("primary_artist", {}).get("name", "").lower()
-                    
-                    # Skip garbage playlist/tracklist hits
-                    if any(x in artist for x in ["spotify", "genius", "apple music", "various"]):
-                        continue
-                    if any(x in title for x in ["tracklist", "setlist", "playlist", "singles"]):
-                        continue
-                        
-                    song_id = result["id"]
-                    
-                    # 1. Try Genius Web Scraping
-                    lyrics_data = get_lyrics_by_id(song_id)
-                    if lyrics_data and lyrics_data.get("lyrics"):
-                        return {"lyrics": lyrics_data["lyrics"]}
-                        
-                    # 2. If Genius scraping is blocked (e.g. on Vercel), Fallback to LRCLib
-                    from app.genius_lyrics import fetch_lrclib_lyrics, search_google_lyrics
-                    lrc = fetch_lrclib_lyrics(title, artist)
-                    if lrc:
-                        return {"lyrics": lrc}
-                        
-                    # 3. Last Resort Fallback: Google Search
-                    ggl = search_google_lyrics(title, artist)
-                    if ggl:
-                        return {"lyrics": ggl}
-                        
-    except Exception as e:
-        print(f"Direct Genius Search Error: {e}")
+class FilenameBatchRequest(BaseModel):
+    filenames: list[str]
 
-    return {"lyrics": None}
+FILENAME_BATCH_MAX = 100
+FILENAME_BATCH_WORKERS = 6
+
+@router.post("/api/genius/fetch-by-filename/batch")
+def api_fetch_lyrics_by_filename_batch(data: FilenameBatchRequest):
+    """
+    Resolve lyrics for many audio filenames at once.
+    Filenames that clean up to the same search query are resolved once; results are streamed
+    back as NDJSON lines ({"filename", "lyrics"}) in completion order.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from app.genius_lyrics import clean_audio_filename, resolve_lyrics_by_filename
+
+    if len(data.filenames) > FILENAME_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Too many filenames (max {FILENAME_BATCH_MAX}).")
+
+    groups = {}
+    for name in data.filenames:
+        groups.setdefault(clean_audio_filename(name).lower(), []).append(name)
+
+    def stream():
+        with ThreadPoolExecutor(max_workers=FILENAME_BATCH_WORKERS) as pool:
+            futures = {pool.submit(resolve_lyrics_by_filename, names[0]): names for names in groups.values()}
+            for future in as_completed(futures):
+                try:
+                    lyrics = future.result()
+                except Exception as e:
+                    print(f"BATCH FILENAME LYRICS ERROR: {e}")
+                    lyrics = None
+                for name in futures[future]:
+                    yield json.dumps({"filename": name, "lyrics": lyrics}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 async def run_analysis_logic(profile_id: str):
     print(f"[START] Processing analysis for: {profile_id}")
@@ -1669,7 +1744,7 @@ async def start_background_analysis(
             "Content-Type": "application/json"
         }
         try:
-            response = requests.post(
+            response = http_handler.post(
                 qstash_url,
                 headers=headers,
                 data=json.dumps({"profile_id": profile_id})
@@ -1764,7 +1839,7 @@ async def fire_qstash_event(
             "Content-Type": "application/json"
         }
         try:
-            requests.post(
+            http_handler.post(
                 qstash_url,
                 headers=headers,
                 data=json.dumps({"action": action, "data": metadata})
@@ -1798,14 +1873,15 @@ async def lastfm_enhancement_task(request: Request):
     username = data.get("username")
     time_range = data.get("time_range", "medium_term")
     extended = data.get("extended", False)
-    result = data.get("result")
+    result = data.get("result") # Only set by messages published before results moved to the cache
     force_sync = data.get("force_sync", False)
+    enhance_id = data.get("enhance_id")
 
     print(f"QSTASH WORKER: Starting Last.fm Enhancement for {username} (Force: {force_sync})")
 
     try:
         from app.lastfm_handler import process_lastfm_enhancement_background
-        process_lastfm_enhancement_background(username, time_range, result, extended, force_sync)
+        process_lastfm_enhancement_background(username, time_range, result, extended, force_sync, enhance_id=enhance_id)
         return {"status": "Enhancement Complete"}
     except Exception as e:
         print(f"QSTASH WORKER ERROR (LFM): {e}")
@@ -1860,6 +1936,41 @@ async def analyze_sentiment_task(request: Request):
         print(f"QSTASH WORKER ERROR: {e}")
         return {"status": "Failed", "error": str(e)}
 
+@router.post("/api/tasks/refresh-media")
+async def refresh_media_task(request: Request):
+    """
+    QStash Worker Endpoint: re-resolves stale media_metadata imagery.
+    Driven by a QStash schedule (see README), so stale rows are refreshed without an admin.
+    """
+    receiver = get_qstash_receiver()
+    signature = request.headers.get("Upstash-Signature")
+    body_bytes = await request.body()
+
+    app_url = os.getenv("APP_URL", "")
+    if "localhost" not in app_url and "127.0.0.1" not in app_url:
+        try:
+            receiver.verify(
+                body=body_bytes.decode("utf-8"),
+                signature=signature,
+                url=str(request.url)
+            )
+        except Exception as e:
+            return {"status": "Forbidden", "error": str(e)}
+
+    try:
+        data = json.loads(body_bytes or b"{}")
+    except Exception:
+        data = {}
+    limit = min(max(int(data.get("limit", 50)), 1), 500)
+
+    try:
+        from app.lastfm_handler import refresh_stale_media_metadata
+        meta = await asyncio.to_thread(refresh_stale_media_metadata, limit)
+        return {"status": "Media Refresh Complete", **meta}
+    except Exception as e:
+        print(f"QSTASH WORKER ERROR (MEDIA REFRESH): {e}")
+        return {"status": "Failed", "error": str(e)}
+
 @router.post("/api/tasks/log-activity")
 async def log_activity_task(request: Request):
     receiver = get_qstash_receiver()
@@ -1894,7 +2005,7 @@ def get_recently_played(
     url = f"https://api.spotify.com/v1/me/player/recently-played?limit={limit}"
     
     try:
-        response = requests.get(url, headers=headers)
+        response = http_handler.get(url, headers=headers)
         if response.status_code == 401 and spotify_id:
              print(f"HISTORY 401 for {spotify_id}. RETRYING WITH REFRESH.")
              # REFRESH LOGIC
@@ -1908,7 +2019,7 @@ def get_recently_played(
                     "client_id": client_id,
                     "client_secret": client_secret
                  }
-                 res = requests.post("https://accounts.spotify.com/api/token", data=payload, headers={"Content-Type": "application/x-www-form-urlencoded"})
+                 res = http_handler.post("https://accounts.spotify.com/api/token", data=payload, headers={"Content-Type": "application/x-www-form-urlencoded"})
                  if res.status_code == 200:
                      tokens = res.json()
                      new_access = tokens.get("access_token")
@@ -1920,7 +2031,7 @@ def get_recently_played(
                      
                      # RETRY
                      headers["Authorization"] = f"Bearer {new_access}"
-                     response = requests.get(url, headers=headers)
+                     response = http_handler.get(url, headers=headers)
 
         if response.status_code != 200:
              raise HTTPException(status_code=response.status_code, detail=f"Spotify API Error: {response.text}")
@@ -1972,7 +2083,7 @@ def get_user_profile_detail(
     headers = {"Authorization": f"Bearer {access_token}"}
     
     try:
-        response = requests.get("https://api.spotify.com/v1/me", headers=headers)
+        response = http_handler.get("https://api.spotify.com/v1/me", headers=headers)
         
         # REFRESH LOGIC
         if response.status_code == 401 and spotify_id:
@@ -1987,7 +2098,7 @@ def get_user_profile_detail(
                     "client_id": client_id,
                     "client_secret": client_secret
                  }
-                 res = requests.post("https://accounts.spotify.com/api/token", data=payload, headers={"Content-Type": "application/x-www-form-urlencoded"})
+                 res = http_handler.post("https://accounts.spotify.com/api/token", data=payload, headers={"Content-Type": "application/x-www-form-urlencoded"})
                  if res.status_code == 200:
                      tokens = res.json()
                      new_access = tokens.get("access_token")
@@ -1999,7 +2110,7 @@ def get_user_profile_detail(
                      
                      # RETRY
                      headers["Authorization"] = f"Bearer {new_access}"
-                     response = requests.get("https://api.spotify.com/v1/me", headers=headers)
+                     response = http_handler.get("https://api.spotify.com/v1/me", headers=headers)
 
         if response.status_code != 200:
              raise HTTPException(status_code=response.status_code, detail=f"Spotify API Error: {response.text}")
@@ -2027,6 +2138,44 @@ def get_user_profile_detail(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Backend Error: {str(e)}")
 
+@router.get("/api/lastfm/{username}/top", tags=["Last.fm Data"])
+def lastfm_scrobble_top(
+    username: str,
+    kind: str = Query("artists", pattern="^(artists|tracks)$"),
+    start: datetime.date = Query(..., description="First day (inclusive), YYYY-MM-DD"),
+    end: Optional[datetime.date] = Query(None, description="Last day (inclusive), defaults to today"),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """
+    Top artists or tracks for any date range, aggregated from the ingested scrobble history.
+    History is ingested in the background on each Last.fm sync; `scrobbles_ingested_until` tells
+    how far it currently reaches.
+    """
+    from app.lastfm_handler import get_scrobble_top_items
+    from app.db_handler import get_scrobble_cursor
+
+    end = end or datetime.date.today()
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    start_uts = int(datetime.datetime.combine(start, datetime.time.min, tzinfo=timezone.utc).timestamp())
+    end_uts = int(datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min, tzinfo=timezone.utc).timestamp())
+
+    try:
+        data = get_scrobble_top_items(username, kind, start_uts, end_uts, limit)
+        cursor = get_scrobble_cursor(f"lastfm:{username}")
+    except Exception as e:
+        print(f"LASTFM SCROBBLE TOP ERROR: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "username": username,
+        "kind": kind,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "scrobbles_ingested_until": datetime.datetime.fromtimestamp(cursor, timezone.utc).isoformat() if cursor else None,
+        **data
+    }
+
 @router.get("/api/active-provider", tags=["Settings"])
 def api_get_active_provider():
     """Get system-wide active provider (spotify or lastfm)"""
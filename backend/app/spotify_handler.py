@@ -1,13 +1,13 @@
-
-import requests
+import os
+import time
+import base64
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app import http_handler
 
 from fastapi import HTTPException, BackgroundTasks
-from app.db_handler import (
-    save_user,
-    save_artists_batch,
-    save_tracks_batch,
-    save_user_associations_batch
-)
+from app.db_handler import save_sync_batch
 from app.cache_handler import (
     cache_top_data, 
     acquire_analysis_lock, 
@@ -16,6 +16,91 @@ from app.cache_handler import (
 from app.mongo_handler import save_user_sync
 from app.nlp_handler import generate_sentiment_analysis
 
+# --- CLIENT CREDENTIALS TOKEN ---
+
+# Refresh this many seconds before Spotify's expires_in runs out
+APP_TOKEN_REFRESH_MARGIN = 300
+
+_app_token = {"token": None, "expires_at": 0.0}
+_app_token_lock = threading.Lock()
+
+def _request_spotify_app_token():
+    """POST /api/token with client credentials. Returns (token, expires_in) or (None, 0)."""
+    client_id = os.getenv("SPOTIFY_CLIENT_ID")
+    client_secret = os.getenv("SPOTIFY_CLIENT_SECRET")
+    if not client_id or not client_secret:
+        print("SPOTIFY APP TOKEN ERROR: Missing credentials in .env")
+        return None, 0
+
+    b64_auth_str = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+    headers = {
+        "Authorization": f"Basic {b64_auth_str}",
+        "Content-Type": "application/x-www-form-urlencoded"
+    }
+    try:
+        res = http_handler.post("https://accounts.spotify.com/api/token", headers=headers, data={"grant_type": "client_credentials"}, timeout=5)
+        if res.status_code == 200:
+            data = res.json()
+            token = data.get("access_token")
+            if token:
+                print(f"SPOTIFY APP TOKEN: Successfully retrieved (starts with {token[:6]}...)")
+            return token, int(data.get("expires_in", 3600))
+        print(f"SPOTIFY APP TOKEN ERROR: {res.status_code} - {res.text}")
+    except Exception as e:
+        print(f"SPOTIFY APP TOKEN ERROR: {e}")
+    return None, 0
+
+def _fresh(entry):
+    return entry and entry.get("token") and entry["expires_at"] - time.time() > APP_TOKEN_REFRESH_MARGIN
+
+def get_spotify_app_token(force_refresh=False):
+    """
+    Spotify client-credentials token, cached in-process and in Redis until shortly before expiry.
+    Concurrent refreshes are single-flighted: one thread per process (lock) and one process
+    across instances (Redis lock) talks to accounts.spotify.com; the rest reuse its token.
+    """
+    from app.cache_handler import r, _release_lock, get_spotify_app_token_cache, set_spotify_app_token_cache
+
+    if not force_refresh and _fresh(_app_token):
+        return _app_token["token"]
+
+    with _app_token_lock:
+        if not force_refresh and _fresh(_app_token):
+            return _app_token["token"]
+
+        if not force_refresh:
+            shared = get_spotify_app_token_cache()
+            if _fresh(shared):
+                _app_token.update(shared)
+                return shared["token"]
+
+        lock_token = uuid.uuid4().hex
+        try:
+            have_lock = r.set("lock:spotify:app_token", lock_token, ex=10, nx=True)
+        except Exception:
+            have_lock = True # Redis down: just fetch
+
+        if not have_lock:
+            # Another instance is refreshing; wait briefly for it to publish
+            for _ in range(15):
+                time.sleep(0.2)
+                shared = get_spotify_app_token_cache()
+                if _fresh(shared):
+                    _app_token.update(shared)
+                    return shared["token"]
+
+        try:
+            token, expires_in = _request_spotify_app_token()
+            if token:
+                expires_at = time.time() + expires_in
+                _app_token.update(token=token, expires_at=expires_at)
+                set_spotify_app_token_cache(token, expires_at, ttl=expires_in - APP_TOKEN_REFRESH_MARGIN)
+            return token
+        finally:
+            if have_lock:
+                # Owner-checked: a refresh that outlived the lock must not drop another instance's
+                _release_lock("lock:spotify:app_token", lock_token)
+
 def process_sentiment_background(spotify_id, time_range, result, extended=False, sync_id=None):
     """
     Helper function to run emotion analysis and caching.
@@ -108,10 +193,19 @@ def sync_user_data(access_token: str, time_range: str = "medium_term", backgroun
     Returns the formatted result dictionary (immediately if background_tasks is used).
     """
     headers = {"Authorization": f"Bearer {access_token}"}
-    
-    # 1. Fetch User Profile
-    res = requests.get("https://api.spotify.com/v1/me", headers=headers)
-    
+
+    # 1. Fetch User Profile + Top Data concurrently (independent calls, one round trip)
+    # Note: Fetching 20 to allow flexibility (Web Top 20). 
+    # Analysis will conditionalize between Top 10 or Top 20.
+    artist_url = f"https://api.spotify.com/v1/me/top/artists?time_range={time_range}&limit=20"
+    track_url = f"https://api.spotify.com/v1/me/top/tracks?time_range={time_range}&limit=20"
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        profile_future = executor.submit(http_handler.get, "https://api.spotify.com/v1/me", headers=headers)
+        artist_future = executor.submit(http_handler.get, artist_url, headers=headers)
+        track_future = executor.submit(http_handler.get, track_url, headers=headers)
+    res = profile_future.result()
+
     if res.status_code == 401:
         print(f"SYNC ERROR: TOKEN EXPIRED FOR ACCESS_TOKEN={access_token[:10]}...")
         raise HTTPException(status_code=401, detail="Spotify token expired. Please login again.")
@@ -128,18 +222,14 @@ def sync_user_data(access_token: str, time_range: str = "medium_term", backgroun
     user_profile = res.json()
     spotify_id = user_profile["id"]
     display_name = user_profile.get("display_name", "Unknown")
-    
-    # Save User to DB
-    save_user(spotify_id, display_name)
 
-    # 2. Fetch Top Data
-    # Note: Fetching 20 to allow flexibility (Web Top 20). 
-    # Analysis will conditionalize between Top 10 or Top 20.
-    artist_url = f"https://api.spotify.com/v1/me/top/artists?time_range={time_range}&limit=20"
-    track_url = f"https://api.spotify.com/v1/me/top/tracks?time_range={time_range}&limit=20"
-
-    artist_resp = requests.get(artist_url, headers=headers)
-    track_resp = requests.get(track_url, headers=headers)
+    # 2. Top Data (already fetched above)
+    try:
+        artist_resp = artist_future.result()
+        track_resp = track_future.result()
+    except Exception as e:
+        print(f"SYNC ERROR: FAILED TO FETCH TOP DATA: {e}")
+        raise HTTPException(status_code=502, detail="Failed to fetch top data from Spotify.")
 
     if artist_resp.status_code != 200 or track_resp.status_code != 200:
         raise HTTPException(status_code=401, detail="Failed to sync data. Token might be expired.")
@@ -183,10 +273,8 @@ def sync_user_data(access_token: str, time_range: str = "medium_term", backgroun
             album_image_url
         ))
 
-    save_artists_batch(artists_to_save)
-    save_tracks_batch(tracks_to_save)
-    save_user_associations_batch("user_artists", "artist_id", spotify_id, artist_ids)
-    save_user_associations_batch("user_tracks", "track_id", spotify_id, track_ids)
+    # One transaction on one pooled connection for the user, artists, tracks and associations
+    save_sync_batch(spotify_id, display_name, artists_to_save, tracks_to_save, artist_ids, track_ids)
     
     # 4. Extract Genres & Compute Top List
     genre_count = {}
@@ -0,0 +1,69 @@
+import sys
+import types
+import unittest
+from unittest import mock
+
+from app import http_handler
+
+
+class FakeRedis:
+    """Token bucket stand-in: the script returns the queued wait_ms values, then 0."""
+
+    def __init__(self, waits):
+        self.waits = list(waits)
+        self.calls = 0
+
+    def register_script(self, source):
+        def script(keys, args):
+            self.calls += 1
+            return self.waits.pop(0) if self.waits else 0
+        return script
+
+
+class RateLimitWaitTest(unittest.TestCase):
+    URL = "https://api.genius.com/search"
+
+    def setUp(self):
+        http_handler._limiter_script = None
+        http_handler.reset_http_metrics()
+        self.redis = FakeRedis([])
+        cache_handler = types.ModuleType("app.cache_handler")
+        cache_handler.r = self.redis
+        patches = [
+            mock.patch.dict(sys.modules, {"app.cache_handler": cache_handler}),
+            mock.patch.object(http_handler.time, "sleep"),
+            mock.patch.object(http_handler, "get_session"),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.sleep = http_handler.time.sleep
+        self.session = http_handler.get_session.return_value
+        self.session.request.return_value = mock.Mock(status_code=200)
+
+    def tearDown(self):
+        http_handler._limiter_script = None
+
+    def test_latency_bound_call_fails_fast_when_bucket_is_empty(self):
+        self.redis.waits = [2000]
+        with self.assertRaises(http_handler.RateLimitExceeded):
+            http_handler.get(self.URL, retries=0)
+        self.sleep.assert_not_called()
+        self.session.request.assert_not_called()
+
+    def test_latency_bound_call_waits_within_fast_bound(self):
+        self.redis.waits = [int(http_handler.RATE_LIMIT_FAST_WAIT * 1000) // 2]
+        res = http_handler.get(self.URL, retries=0)
+        self.assertEqual(res.status_code, 200)
+        self.sleep.assert_called_once_with(http_handler.RATE_LIMIT_FAST_WAIT / 2)
+
+    def test_default_call_still_waits_up_to_max_wait(self):
+        self.redis.waits = [2000]
+        res = http_handler.get(self.URL)
+        self.assertEqual(res.status_code, 200)
+        self.sleep.assert_called_once_with(2.0)
+        self.assertEqual(self.redis.calls, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -55,6 +55,7 @@ export default function GeniusPage() {
     const subtitleRef = useRef<HTMLParagraphElement>(null);
     const hasTyped = useRef(false);
     const debounceTimer = useRef<NodeJS.Timeout | null>(null);
+    const songsRequest = useRef<AbortController | null>(null);
 
     // Handle SPA navigation for typewriter links
     useEffect(() => {
@@ -124,6 +125,7 @@ export default function GeniusPage() {
             dispatchError("Please enter an artist name first!");
             return;
         }
+        songsRequest.current?.abort();
         setLoadingState("search");
         setArtists([]);
         setSongs([]);
@@ -197,22 +199,43 @@ export default function GeniusPage() {
         setSelectedArtist(artist);
         setLoadingState("songs");
 
+        // Only the latest artist's responses may touch the list
+        songsRequest.current?.abort();
+        const controller = new AbortController();
+        songsRequest.current = controller;
+        const { signal } = controller;
+
+        let firstPageShown = false;
         try {
-            const res = await fetch(`/api/genius/artist-songs/${artist.id}`);
+            // Render the first page right away, then swap in the full discography
+            const res = await fetch(`/api/genius/artist-songs/${artist.id}?page=1`, { signal });
             const data = await res.json();
-            if (data.songs) {
+            if (signal.aborted) return;
+            if (data.songs && data.songs.length) {
                 setSongs(data.songs);
+                setLoadingState(null);
+                firstPageShown = true;
+                if (data.next_page) {
+                    const fullRes = await fetch(`/api/genius/artist-songs/${artist.id}`, { signal });
+                    const fullData = await fullRes.json();
+                    if (signal.aborted) return;
+                    if (fullData.songs && fullData.songs.length) setSongs(fullData.songs);
+                }
             } else {
                 dispatchError("No songs found.");
             }
         } catch (e) {
-            dispatchError("Error loading songs.");
+            if (signal.aborted) return;
+            // Page 1 is already on screen; a failed full-list fetch just keeps it
+            if (firstPageShown) console.error(e);
+            else dispatchError("Error loading songs.");
         } finally {
-            setLoadingState(null);
+            if (!signal.aborted) setLoadingState(null);
         }
     };
 
     const handleClearSearch = () => {
+        songsRequest.current?.abort();
         setQuery("");
         setSuggestions([]);
         setArtists([]);